@@ -1,32 +1,39 @@
 # dashboard_mapped.py
 import streamlit as st
 import pandas as pd
+import numpy as np
+import pyarrow as pa
 import plotly.express as px
-import re
-import geopandas as gpd
 import pydeck as pdk
 import os
-import glob
 from PIL import Image
 from io import BytesIO
 import base64
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from streamlit_plotly_events import plotly_events
 import plotly.graph_objects as go
 import matplotlib.pyplot as plt
 import requests
 from streamlit import cache_data
-from docx import Document
-from docx.shared import Pt
-from docx.enum.text import WD_COLOR_INDEX
-from collections import OrderedDict
-from openpyxl.styles import Font, PatternFill
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import Border, Side
-import io
-from io import BytesIO
-from openpyxl import Workbook
-from openpyxl.drawing.image import Image as XLImage
-from openpyxl.styles import numbers
+from gaeltec_core import (
+    CATEGORY_COLUMNS, COLUMNAR_FORMATS, DATE_SOURCES, MASTER_COLUMNS, MISC_COLUMNS,
+    categories, column_rename_map,
+    arrow_view, build_date_view, build_export_df, build_filter_index, build_output_workbook, build_poles_df,
+    build_rollup_cube, bundle_zip, columnar_export, date_rows, generate_excel_styled_multilevel,
+    index_mask, index_options, iter_row_groups, materials_aggregated_excel, materials_aggregated_frame,
+    materials_category, materials_separated_excel, materials_separated_frame, output_details_frame,
+    partition_frames, poles_to_word, prepare_dataframe, read_masters, read_parquet_columns,
+    revenue_tables, stream_aggregates, stream_batches, stream_rows, table_page, to_excel, ward_activity,
+)
+from gaeltec_maps import (
+    MAPS_DIR, areas_by_name, choropleth_colors, load_geometry_store, map_view, name_index, pick_level,
+    polygon_payload,
+)
 
 # --- Page config for wide layout ---
 st.set_page_config(
@@ -35,16 +42,6 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-def sanitize_sheet_name(name: str) -> str:
-    """
-    Remove or replace invalid characters for Excel sheet names.
-    Excel sheet names cannot contain: : \ / ? * [ ]
-    """
-    name = str(name)
-    name = re.sub(r'[:\\/*?\[\]]', '_', name)
-    name = re.sub(r'[^\x00-\x7F]', '_', name)
-    return name[:31]
-
 def get_scottish_weather(api_key, location="Ayrshire"):
     """
     Get weather data for Scottish locations
@@ -111,97 +108,6 @@ def get_weather_forecast(api_key, location="Ayrshire"):
         return None
 
 
-def poles_to_word(df: pd.DataFrame) -> BytesIO:
-    doc = Document()
-
-    # Defensive cleaning
-    df = df.copy()
-    df = df.replace(
-        to_replace=["nan", "NaN", "None", None],
-        value=""
-    )
-
-    grouped = df.groupby('pole', sort=False)
-
-    for pole, group in grouped:
-        pole_str = str(pole).strip()
-        if not pole_str:
-            continue
-
-        # Ordered set using dict keys (preserves order, removes duplicates)
-        unique_texts = OrderedDict()
-
-        for _, row in group.iterrows():
-            parts = []
-
-            wi = str(row.get('Work instructions', '')).strip()
-            comment = str(row.get('comment', '')).strip()
-
-            if wi:
-                parts.append(wi)
-
-            if comment:
-                parts.append(f"({comment})")
-
-            if parts:
-                text = " ".join(parts)
-
-                # Normalize for deduplication
-                normalized = text.lower().strip()
-
-                unique_texts[normalized] = text
-
-        if not unique_texts:
-            continue
-
-        # Bullet paragraph
-        p = doc.add_paragraph(style='List Bullet')
-
-        run_number = p.add_run(f"{pole_str} – ")
-        run_number.bold = True
-        run_number.font.name = 'Times New Roman'
-        run_number.font.size = Pt(12)
-
-        texts = list(unique_texts.values())
-
-        for i, text in enumerate(texts):
-            run_item = p.add_run(text)
-            run_item.bold = True
-            run_item.font.name = 'Times New Roman'
-            run_item.font.size = Pt(12)
-
-            if "Erect Pole" in text:
-                run_item.font.highlight_color = WD_COLOR_INDEX.RED
-
-            if i < len(texts) - 1:
-                p.add_run(" ; ")
-
-    buffer = BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-    return buffer
-
-def build_export_df(filtered_df):
-    export_df = filtered_df.copy()
-
-    # Rename columns
-    export_df = export_df.rename(columns=column_rename_map)
-
-    # Keep only columns that actually exist
-    existing_cols = [c for c in export_columns if c in export_df.columns]
-    export_df = export_df[existing_cols]
-
-    return export_df
-
-# Normalize strings: remove leading/trailing spaces, lowercase, remove extra dots
-def normalize_item(s):
-    if pd.isna(s):
-        return ""
-    s = str(s).strip().lower()           # strip spaces and lowercase
-    s = s.replace(".", "")               # remove dots
-    s = re.sub(r"\s+", " ", s)          # collapse multiple spaces
-    return s
-
 def apply_common_filters(df):
     df = df.copy()
 
@@ -231,522 +137,267 @@ def apply_common_filters(df):
 
     return df.dropna(subset=['datetouse_dt'])
     
-def prepare_dataframe(df):
-    df = df.copy()
-    df.columns = df.columns.str.strip().str.lower()
-
-    if 'datetouse' in df.columns:
-        df['datetouse_dt'] = pd.to_datetime(df['datetouse'], errors='coerce').dt.normalize()
-    else:
-        df['datetouse_dt'] = pd.NaT
-
-    # Make numeric columns safe
-    for col in ['total', 'orig']:
-        if col in df.columns:
-            df[col] = (
-                df[col].astype(str)
-                .str.replace(" ", "")
-                .str.replace(",", ".", regex=False)
-                .astype(float)
-            )
-
-    return df
-
-def multi_select_filter(col, label, df):
-    if col not in df.columns:
-        return ["All"], df
-
-    options = ["All"] + sorted(df[col].dropna().astype(str).unique())
-    selected = st.sidebar.multiselect(label, options, default=["All"])
-
-    if "All" in selected:
-        return selected, df
-
-    return selected, df[df[col].astype(str).isin(selected)]
-
-
-
-def to_excel(project_df, team_df):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-
-        # ---- Sheet 1: Revenue per Project ----
-        if not project_df.empty:
-            project_df.to_excel(writer, index=False, sheet_name="Revenue per Project", startrow=1)
-            ws_proj = writer.sheets["Revenue per Project"]
-
-            # ---- Column widths ----
-            ws_proj.column_dimensions["A"].width = 30
-            ws_proj.column_dimensions["B"].width = 18
-
-            # ---- Styles ----
-            header_font = Font(bold=True, size=14)
-            header_fill = PatternFill(start_color="00CCFF", end_color="00CCFF", fill_type="solid")
-            thin_side = Side(style="thin")
-            medium_side = Side(style="medium")
-            thick_side = Side(style="thick")
-            light_grey_fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
-            white_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
-
-            max_col = ws_proj.max_column
-            max_row = ws_proj.max_row
-
-            # Set row 1 height for images
-            ws_proj.row_dimensions[1].height = 120
-
-            # Header → row 2
-            for col_idx, cell in enumerate(ws_proj[2], start=1):
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.border = Border(
-                    left=thick_side if col_idx == 1 else medium_side,
-                    right=thick_side if col_idx == max_col else medium_side,
-                    top=thick_side,
-                    bottom=thick_side
-                )
-
-            # Data rows → start row 3
-            for row_idx in range(3, max_row + 1):
-                fill = light_grey_fill if row_idx % 2 == 0 else white_fill
-                for col_idx in range(1, max_col + 1):
-                    cell = ws_proj.cell(row=row_idx, column=col_idx)
-                    cell.fill = fill
-                    cell.border = Border(
-                        left=thin_side,
-                        right=thin_side,
-                        top=thin_side,
-                        bottom=thin_side
-                    )
+def file_digest(uploaded_file) -> str:
+    """
+    SHA-256 of an uploaded file's bytes.
+    Memoised per upload in session state so reruns don't rehash the file.
+    """
+    digests = st.session_state.setdefault("file_digests", {})
+    key = getattr(uploaded_file, "file_id", None) or uploaded_file.name
+    if key not in digests:
+        digests[key] = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    return digests[key]
 
-            # ---- Add images in row 1 ----
-            img1 = XLImage("Images/GaeltecImage.png")
-            img2 = XLImage("Images/SPEN.png")
-            img1.width = 120; img1.height = 120; img1.anchor = "A1"
-            img2.width = 360; img2.height = 120; img2.anchor = "B1"
-            ws_proj.add_image(img1)
-            ws_proj.add_image(img2)
-
-        # ---- Sheet 2: Revenue per Team ----
-        if not team_df.empty:
-            team_df.to_excel(writer, index=False, sheet_name="Revenue per Team", startrow=1)
-            ws_team = writer.sheets["Revenue per Team"]
-
-            ws_team.column_dimensions["A"].width = 25
-            ws_team.column_dimensions["B"].width = 18
-
-            max_col = ws_team.max_column
-            max_row = ws_team.max_row
-
-            # Row 1 for images
-            ws_team.row_dimensions[1].height = 120
-
-            # Header → row 2
-            for col_idx, cell in enumerate(ws_team[2], start=1):
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.border = Border(
-                    left=thick_side if col_idx == 1 else medium_side,
-                    right=thick_side if col_idx == max_col else medium_side,
-                    top=thick_side,
-                    bottom=thick_side
-                )
+def files_digest(uploaded_files) -> str:
+    # One key for a set of uploads; names count because they drive the sourcefile tag
+    combined = "|".join(sorted(f"{f.name}:{file_digest(f)}" for f in uploaded_files))
+    return hashlib.sha256(combined.encode()).hexdigest()
 
-            # Data rows → start row 3
-            for row_idx in range(3, max_row + 1):
-                fill = light_grey_fill if row_idx % 2 == 0 else white_fill
-                for col_idx in range(1, max_col + 1):
-                    cell = ws_team.cell(row=row_idx, column=col_idx)
-                    cell.fill = fill
-                    cell.border = Border(
-                        left=thin_side,
-                        right=thin_side,
-                        top=thin_side,
-                        bottom=thin_side
-                    )
+def file_sources(uploaded_files):
+    return [(f.name, f.getvalue()) for f in uploaded_files]
 
-            # ---- Add images in row 1 ----
-            img1 = XLImage("Images/GaeltecImage.png")
-            img2 = XLImage("Images/SPEN.png")
-            img1.width = 120; img1.height = 120; img1.anchor = "A1"
-            img2.width = 360; img2.height = 120; img2.anchor = "B1"
-            ws_team.add_image(img1)
-            ws_team.add_image(img2)
-
-    output.seek(0)
-    return output
-
-def generate_excel_styled_multilevel(filtered_df, poles_df=None):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Daily Revenue"
-
-    # ---- Sheet 1: Daily Revenue ----
-    if {'shire', 'project','region','segmentdesc', 'segmentcode', 'projectmanager', 'datetouse_dt', 'total'}.issubset(filtered_df.columns):
-        daily_df = (
-            filtered_df
-            .groupby(['datetouse_dt','shire','project','region','segmentdesc','segmentcode','projectmanager'], as_index=False)
-            .agg({'total':'sum'})
-        )
-        daily_df.rename(columns={
-            'datetouse_dt':'Date',
-            'total':'Revenue (£)',
-            'region':'location',
-            'segmentdesc':'Detail',
-            'segmentcode':'Circuit',
-            'projectmanager':'Project Manager'
-        }, inplace=True)
-
-        # Write header in ROW 2 (row 1 reserved for images)
-        for col_idx, col_name in enumerate(daily_df.columns.tolist(), start=1):
-            ws.cell(row=2, column=col_idx, value=col_name)
-
-        # Write data starting from row 3
-        for r_idx, row in enumerate(daily_df.values.tolist(), start=3):
-            for c_idx, value in enumerate(row, start=1):
-                ws.cell(row=r_idx, column=c_idx, value=value)
-
-    # ---- Sheet 2: Poles Summary ----
-    ws_summary = wb.create_sheet(title="Poles Summary")
-    if poles_df is not None and not poles_df.empty:
-        poles_summary = (
-            poles_df[['shire','project','segmentcode','pole']]
-            .drop_duplicates()
-            .groupby(['shire','project','segmentcode'], as_index=False)
-            .agg({'pole': lambda x: ', '.join(sorted(x.astype(str)))})
-        )
-        poles_summary.rename(columns={'pole':'Poles', 'segmentcode':'Segment'}, inplace=True)
-
-        # Write multi-level headers (Row 2-4)
-        headers = ['Shire','Project','Segment','location_map','Poles']
-        for idx, h in enumerate(headers, start=1):
-            ws_summary.cell(row=2, column=idx, value=h)  # Shire header
-            ws_summary.cell(row=3, column=idx, value=h if h != 'Poles' else '')  # Project header
-            ws_summary.cell(row=4, column=idx, value=h if h != 'Poles' else '')  # Segment header
-
-        # Write data starting from row 5
-        for r_idx, row in enumerate(poles_summary.values.tolist(), start=5):
-            for c_idx, value in enumerate(row, start=1):
-                ws_summary.cell(row=r_idx, column=c_idx, value=value)
-
-    # ---- Formatting styles ----
-    header_font = Font(bold=True, size=16)
-    header_fill = PatternFill(start_color="00CCFF", end_color="00CCFF", fill_type="solid")
-    thin_side = Side(style="thin")
-    medium_side = Side(style="medium")
-    thick_side = Side(style="thick")
-    light_grey_fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
-    white_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
-
-    # ---- Add images ----
-    IMG_HEIGHT = 120
-    IMG_WIDTH_SMALL = 120
-    IMG_WIDTH_LARGE = IMG_WIDTH_SMALL * 3
-
-    # Set row 1 height to fit images
-    ws.row_dimensions[1].height = IMG_HEIGHT * 0.75  # approximate pixels → Excel points
-    ws_summary.row_dimensions[1].height = IMG_HEIGHT * 0.75
-
-    # Position images (row 1)
-    img1.anchor = "B1"
-    img2.anchor = "A1"
-
-    ws.add_image(img1)
-    ws.add_image(img2)
-
-    # Same for Summary
-    img1_s = XLImage("Images/GaeltecImage.png")
-    img2_s = XLImage("Images/SPEN.png")
-
-    img1_s.width = IMG_WIDTH_SMALL
-    img1_s.height = IMG_HEIGHT
-    img1_s.anchor = "A1"
-
-    img2_s.width = IMG_WIDTH_LARGE
-    img2_s.height = IMG_HEIGHT
-    img2_s.anchor = "B1"
-
-    # Sheet 2 images
-    img1_s = XLImage("Images/GaeltecImage.png")
-    img2_s = XLImage("Images/SPEN.png")
-    img1_s.width = IMG_WIDTH_SMALL; img1_s.height = IMG_HEIGHT; img1_s.anchor = "A1"
-    img2_s.width = IMG_WIDTH_LARGE; img2_s.height = IMG_HEIGHT; img2_s.anchor = "B1"
-    ws_summary.add_image(img1_s)
-    ws_summary.add_image(img2_s)
-
-    # ---- Apply formatting ----
-    for sheet in [ws, ws_summary]:
-        max_col = sheet.max_column
-        max_row = sheet.max_row
-
-        # Header rows
-        for row_idx in range(2, 5 if sheet == ws_summary else 3):
-            for col_idx in range(1, max_col + 1):
-                cell = sheet.cell(row=row_idx, column=col_idx)
-                cell.font = header_font
-                cell.fill = header_fill
-                sheet.column_dimensions[get_column_letter(col_idx)].width = 60 if col_idx == 1 else 20
-                cell.border = Border(
-                    left=thick_side if col_idx == 1 else medium_side,
-                    right=thick_side if col_idx == max_col else medium_side,
-                    top=thick_side,
-                    bottom=thick_side
-                )
+def normalized_cache_path(digest: str) -> str:
+    return os.path.join(CACHE_DIR, f"master_{digest}_v{NORMALIZED_SCHEMA_VERSION}.parquet")
 
-        # DATA ROWS → after headers
-        start_data_row = 5 if sheet == ws_summary else 3
-        for row_idx in range(start_data_row, max_row + 1):
-            fill = light_grey_fill if row_idx % 2 == 1 else white_fill
-            for col_idx in range(1, max_col + 1):
-                cell = sheet.cell(row=row_idx, column=col_idx)
-                cell.fill = fill
-                cell.border = Border(
-                    left=thin_side,
-                    right=thin_side,
-                    top=thin_side,
-                    bottom=thin_side
-                )
+@st.cache_resource(max_entries=2, show_spinner="Loading Master.parquet...")
+def load_master(digest: str, _uploaded_files) -> pd.DataFrame:
+    """
+    Read and normalize the uploaded master(s) once per distinct set of files.
+    Several per-project parquets are decoded in parallel and stacked.
+    The normalized frame is persisted under CACHE_DIR so a restarted app skips the
+    schema stage too. The returned frame is shared across reruns and sessions - never mutate it.
+    """
+    cache_path = normalized_cache_path(digest)
+    if os.path.exists(cache_path):
+        try:
+            return pd.read_parquet(cache_path)
+        except Exception:
+            pass  # Corrupt or incompatible cache → rebuild below
 
-    # Save to BytesIO
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    return output
+    df = prepare_dataframe(read_masters(file_sources(_uploaded_files), MASTER_COLUMNS))
 
-    
-# --- MAPPINGS ---
-
-# --- Project Manager Mapping ---
-project_mapping = {
-    "Jonathon Mcclung": ["Ayrshire", "PCB"],
-    "Gary MacDonald": ["Ayrshire", "LV"],
-    "Jim Gaffney": ["Lanark", "PCB"],
-    "Calum Thomson": ["Ayrshire", "Connections"],
-    "Calum Thomsom": ["Ayrshire", "Connections"],
-    "Calum Thompson": ["Ayrshire", "Connections"],
-    "Andrew Galt": ["Ayrshire", "-"],
-    "Henry Gordon": ["Ayrshire", "-"],
-    "Jonathan Douglas": ["Ayrshire", "11 kV"],
-    "Jonathon Douglas": ["Ayrshire", "11 kV"],
-    "Matt": ["Lanark", ""],
-    "Lee Fraser": ["Ayrshire", "Connections"],
-    "Lee Frazer": ["Ayrshire", "Connections"],
-    "Mark": ["Lanark", "Connections"],
-    "Mark Nicholls": ["Ayrshire", "Connections"],
-    "Cameron Fleming": ["Lanark", "Connections"],
-    "Ronnie Goodwin": ["Lanark", "Connections"],
-    "Ian Young": ["Ayrshire", "Connections"],
-    "Matthew Watson": ["Lanark", "Connections"],
-    "Aileen Brese": ["Ayrshire", "Connections"],
-    "Mark McGoldrick": ["Lanark", "Connections"]
-}
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass  # Read-only deployments just keep the in-memory cache
 
-# --- Region Mapping ---
-mapping_region = {
-    "Newmilns": ["Irvine Valley"],
-    "New Cumnock": ["New Cumnock"],
-    "Kilwinning": ["Kilwinning"],
-    "Stewarton": ["Irvine Valley"],
-    "Kilbirnie": ["Kilbirnie and Beith"],
-    "Coylton": ["Ayr East"],
-    "Irvine": ["Irvine Valley", "Irvine East", "Irvine West"],
-    "TROON": ["Troon"],
-    "Ayr": ["Ayr East", "Ayr North", "Ayr West"],
-    "Maybole": ["Maybole, North Carrick and Coylton"],
-    "Clerkland": ["Irvine Valley"],
-    "Glengarnock": ["Kilbirnie and Beith"],
-    "Ayrshire": ["North Coast and Cumbraes","Prestwick", "Saltcoats and Stevenston", "Troon", "Ayr East", "Ayr North",
-                 "Ayr West","Annick","Ardrossan and Arran","Dalry and West Kilbride","Girvan and South Carrick","Irvine East",
-                 "Irvine Valley","Irvine West","Kilbirnie and Beith","Kilmarnock East and Hurlford","Kilmarnock North",
-                 "Kilmarnock South","Kilmarnock West and Crosshouse","Kilwinning","Kyle","Maybole, North Carrick and Coylton",
-                 "Ayr, Carrick and Cumnock","East_Ayrshire","North_Ayrshre","South_Ayrshre","Doon Valley"],
-    "Lanark": ["Abronhill, Kildrum and the Village","Airdrie Central","Airdrie North","Airdrie South","Avondale and Stonehouse",
-               "Ballochmyle","Bellshill","Blantyre","Bothwell and Uddingston","Cambuslang East","Cambuslang West",
-               "Clydesdale East","Clydesdale North","Clydesdale South","Clydesdale West","Coatbridge North and Glenboig",
-               "Coatbridge South","Coatbridge West","Cumbernauld North","Cumbernauld South",
-               "East Kilbride Central North","East Kilbride Central South","East Kilbride East","East Kilbride South",
-               "East Kilbride West","Fortissat","Hamilton North and East","Hamilton South","Hamilton West and Earnock",
-               "Mossend and Holytown","Motherwell North","Motherwell South East and Ravenscraig","Motherwell West",
-               "Rutherglen Central and North","Rutherglen South","Strathkelvin","Thorniewood","Wishaw","Larkhall",
-               "Airdrie and Shotts","Cumbernauld, Kilsyth and Kirkintilloch East","East Kilbride, Strathaven and Lesmahagow",
-               "Lanark and Hamilton East","Motherwell and Wishaw","North_Lanarkshire","South_Lanarkshire"]
-}
+    return df
 
-# --- File Project Mapping ---
-file_project_mapping = {
-    "pcb 2022": ["Ayrshire", "PCB"],
-    "33kv refurb": ["Ayrshire", "33kv Refurb"],
-    "connections": ["Ayrshire", "Connections"],
-    "storms": ["Ayrshire", "Storms"],
-    "11kv refurb": ["Ayrshire", "11kv Refurb"],
-    "11kV Refurb Ayrshire 2026": ["Ayrshire", "11kV Refurb"],
-    "11kV Refurb Ayrshire Pinwherry": ["Ayrshire", "11kV Refurb"],
-    "aurs road": ["Ayrshire", "Aurs Road"],
-    "spen labour": ["Ayrshire", "SPEN Labour"],
-    "lvhi5": ["Ayrshire", "LV"],
-    "pcb": ["Ayrshire", "PCB"],
-    "lanark": ["Lanark", ""],
-    "11kv refur": ["Lanark", "11kv Refurb"],
-    "lv & esqcr": ["Lanark", "LV"],
-    "11kv rebuilt": ["Lanark", "11kV Rebuilt"],
-    "33kv rebuilt": ["Lanark", "33kV Rebuilt"],
-    "Hi5_4_Lanark_2026": ["Lanark", "11kV Refurb"]
-}
+@st.cache_resource(max_entries=2)
+def load_date_views(digest: str, _master_df) -> dict:
+    """
+    Filter index plus one date view per DATE_SOURCES entry, all built once per upload
+    so the date-source radio only picks which view is active.
+    """
+    return {
+        'filter_index': build_filter_index(_master_df, CATEGORY_COLUMNS),
+        'views': {
+            source: build_date_view(_master_df, column)
+            for source, column in DATE_SOURCES.items()
+        },
+    }
 
-pole_erected_keys = {
-    "Erect Single HV/EHV Pole, up to and including 12 metre pole":"Erect HV pole", 
-    "Erect Single HV/EHV Pole, up to and including 12 metre pole.":"Erect HV pole",
-    "Erect LV Structure Single Pole, up to and including 12 metre pole" :"Erect LV pole",
-    "Erect Section Structure 'H' HV/EHV Pole, up to and including 12 metre pole.":"H HV pole"
-}
+@st.cache_data(max_entries=32, show_spinner="Streaming Master.parquet row groups...")
+def streamed_aggregates(digest: str, _uploaded_files, spec_key: tuple) -> dict:
+    return stream_aggregates(stream_batches(file_sources(_uploaded_files), dict(spec_key)))
+
+@st.cache_data(max_entries=4, show_spinner="Reading filter options...")
+def stream_filter_options(digest: str, _uploaded_files) -> dict:
+    # Shire / project option lists, streaming only those two columns
+    options = {}
+    for col in ['shire', 'project']:
+        values = set()
+        for _, data in file_sources(_uploaded_files):
+            for batch in iter_row_groups(data, [col]):
+                values.update(batch.iloc[:, 0].dropna().astype(str).unique())
+        options[col] = sorted(values)
+    return options
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Background export jobs: one pool and result store shared by every session
+EXPORT_WORKERS = min(4, os.cpu_count() or 1)
+MAX_EXPORT_JOBS = 32
+MAX_EXPORT_BYTES = 512 * 2**20  # finished files kept in memory, all sessions together
+EXPORT_TTL = 30 * 60            # seconds a finished file stays downloadable
+EXPORT_POLL = 2                 # seconds between status updates while an export is pending
+# Render threads per bundle job; EXPORT_WORKERS bundle jobs may run at once
+BUNDLE_WORKERS = max(1, (os.cpu_count() or 1) // EXPORT_WORKERS)
+
+def export_key(*parts) -> str:
+    # (data version, filter state, export type, ...) → one cache key
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+@st.cache_resource
+def export_jobs() -> dict:
+    return {'pool': ThreadPoolExecutor(max_workers=EXPORT_WORKERS), 'jobs': OrderedDict(), 'lock': threading.Lock()}
+
+def prune_exports(jobs):
+    """
+    Drop finished jobs older than EXPORT_TTL, then the oldest finished ones until at
+    most MAX_EXPORT_JOBS jobs and MAX_EXPORT_BYTES of files are held.
+    Pending jobs are never dropped. Call with the store lock held.
+    """
+    now = time.time()
+    for k in [k for k, j in jobs.items() if 'finished' in j and now - j['finished'] > EXPORT_TTL]:
+        del jobs[k]
+    finished = [(k, j) for k, j in jobs.items() if 'finished' in j]
+    held = sum(j['size'] for _, j in finished)
+    excess = len(jobs) - MAX_EXPORT_JOBS
+    for k, j in finished:
+        if held <= MAX_EXPORT_BYTES and excess <= 0:
+            break
+        del jobs[k]
+        held -= j['size']
+        excess -= 1
+
+def job_finished(job, future):
+    # Done callback: record the file size (set before 'finished', which prune_exports checks)
+    job['size'] = len(future.result()) if future.exception() is None else 0
+    job['finished'] = time.time()
+
+def submit_export(key, build):
+    """
+    Queue `build` on the export pool, or return the job already queued under `key`.
+    `build` runs later on a pool thread, so its inputs must be bound now (partial /
+    default arguments), not read from script variables that later code reassigns.
+    """
+    store = export_jobs()
+    with store['lock']:
+        job = store['jobs'].get(key)
+        if job is None:
+            job = {'future': store['pool'].submit(lambda: build().getvalue()), 'queued': time.time()}
+            job['future'].add_done_callback(partial(job_finished, job))
+            store['jobs'][key] = job
+            prune_exports(store['jobs'])
+        return job
+
+def export_job(key):
+    store = export_jobs()
+    with store['lock']:
+        prune_exports(store['jobs'])
+        return store['jobs'].get(key)
+
+def drop_export(key):
+    store = export_jobs()
+    with store['lock']:
+        store['jobs'].pop(key, None)
+
+def pending_before(key):
+    # Jobs still waiting for a worker that were queued ahead of `key`
+    store = export_jobs()
+    with store['lock']:
+        ahead = 0
+        for k, j in store['jobs'].items():
+            if k == key:
+                break
+            ahead += not j['future'].running() and not j['future'].done()
+        return ahead
+
+@st.fragment(run_every=EXPORT_POLL)
+def export_progress(label, key):
+    # Reruns on its own while the export is pending; once it is done (or gone) the
+    # whole page reruns, so the download button replaces it and polling stops
+    job = export_job(key)
+    if job is None or job['future'].done():
+        st.rerun()
+    elapsed = time.time() - job['queued']
+    if job['future'].running():
+        st.caption(f"⏳ {label}: building… ({elapsed:.0f}s)")
+    else:
+        st.caption(f"🕒 {label}: queued, {pending_before(key)} export(s) ahead ({elapsed:.0f}s)")
 
-poles_replaced_keys = {
-    "Recover single pole, up to and including 15 metres in height, and reinstate, all ground conditions":"Recover single pole",
-    "Recover 'A' / 'H' pole, up to and including 15 metres in height, and reinstate, all ground conditions":"Recover H pole"
-}
+def export_download(label, key, build, file_name, mime=XLSX_MIME):
+    """
+    Prepare button that queues the export in the background and turns into a download
+    button once it has been built. The script thread never serializes workbooks, and
+    finished files stay available under `key` across reruns and sessions until
+    prune_exports evicts them.
+    """
+    job = export_job(key)
+    if job is None:
+        if not st.button(f"⚙️ Prepare {label}", key=f"prepare_{key}"):
+            return
+        job = submit_export(key, build)
+
+    future = job['future']
+    if not future.done():
+        export_progress(label, key)
+        return
+
+    if future.exception() is not None:
+        st.warning(f"Could not build {label}: {future.exception()}")
+        drop_export(key)  # Next click retries
+        return
+    st.download_button(label, data=future.result(), file_name=file_name, mime=mime, key=f"download_{key}")
+
+def frame_download(label, key, build_xlsx, build_frame, file_stem):
+    # Branded workbook, or the same rows as CSV / Parquet / Arrow per the sidebar format
+    if export_format == "xlsx":
+        export_download(f"📥 Download Excel {label}", key, build_xlsx, file_name=f"{file_stem}.xlsx")
+        return
+    ext, mime = COLUMNAR_FORMATS[export_format]
+    export_download(
+        f"📥 Download {ext.upper()} {label}",
+        export_key(key, export_format),
+        lambda build_frame=build_frame, export_format=export_format: columnar_export(build_frame(), export_format),
+        file_name=f"{file_stem}.{ext}",
+        mime=mime,
+    )
 
+@st.cache_resource(max_entries=8)
+def cached_arrow_view(key: str, _df) -> pa.Table:
+    return arrow_view(_df)
 
-# --- Transformer Mappings ---
-transformer_keys = {
-    "Transformer 1ph 50kVA": "TX 1ph (50kVA)",
-    "Transformer 3ph 50kVA": "TX 3ph (50kVA)",
-    "Transformer 1ph 100kVA": "TX 1ph (100kVA)",
-    "Transformer 1ph 25kVA": "TX 1ph (25kVA)",
-    "Transformer 3ph 200kVA": "TX 3ph (200kVA)",
-    "Transformer 3ph 100kVA": "TX 3ph (100kVA)"
-}
+def paged_dataframe(df, key, view_key, page_sizes=(50, 100, 500)):
+    """
+    Show `df` one page at a time with sort and column filter controls.
+    Filtering, sorting and slicing run on a cached Arrow view (under `view_key`),
+    so only the visible page is sent to the browser.
+    """
+    table = cached_arrow_view(view_key, df)
+    names = table.column_names
+    c_sort, c_desc, c_col, c_text, c_size, c_page = st.columns([2, 1, 2, 2, 1, 1])
+    sort_by = c_sort.selectbox("Sort by", ["—"] + names, key=f"{key}_sort")
+    descending = c_desc.checkbox("Descending", key=f"{key}_desc")
+    filter_column = c_col.selectbox("Filter column", names, key=f"{key}_filter_col")
+    filter_text = c_text.text_input("Contains", key=f"{key}_filter_text")
+    page_size = c_size.selectbox("Rows", page_sizes, index=1, key=f"{key}_size")
+    page = c_page.number_input("Page", min_value=1, step=1, key=f"{key}_page")
+
+    rows, n_rows, page = table_page(table, None if sort_by == "—" else sort_by, descending,
+                                    filter_column, filter_text.strip(), page, page_size)
+    st.dataframe(rows, use_container_width=True)
+    first = (page - 1) * page_size
+    st.caption(f"Rows {min(first + 1, n_rows)}–{first + len(rows)} of {n_rows:,} (page {page})")
+
+@st.cache_resource(show_spinner="Loading map areas...")
+def geometry_store():
+    # Deduplicated, pre-parsed Maps/ areas (see gaeltec_maps), loaded once per process
+    store = load_geometry_store(MAPS_DIR, CACHE_DIR)
+    return store, name_index(store)
 
-# --- Equipment / Conductor Mappings ---
-conductor_keys = {
-    "Hazel - 50mm² AAAC bare (1000m drums)": "Hazel 50mm²",
-    "Oak - 100mm² AAAC bare (1000m drums)": "Oak 100mm²",
-    "Ash - 150mm² AAAC bare (1000m drums)": "Ash 150mm²",
-    "Poplar - 200mm² AAAC bare (1000m drums)": "Poplar 200mm²",
-    "Upas - 300mm² AAAC bare (1000m drums)": "Upas 300mm²",
-    "Poplar OPPC - 200mm² AAAC equivalent bare": "Poplar OPPC 200mm²",
-    "Upas OPPC - 300mm² AAAC equivalent bare": "Upas OPPC 300mm²",
-    # ACSR
-    "Gopher - 25mm² ACSR bare (1000m drums)": "Gopher 25mm²",
-    "Caton - 25mm² Compacted ACSR bare (1000m drums)": "Caton 25mm²",
-    "Rabbit - 50mm² ACSR bare (1000m drums)": "Rabbit 50mm²",
-    "Wolf - 150mm² ACSR bare (1000m drums)": "Wolf 150mm²",
-    "Horse - 70mm² ACSR bare": "Horse 70mm²",
-    "Dog - 100mm² ACSR bare (1000m drums)": "Dog 100mm²",
-    "Dingo - 150mm² ACSR bare (1000m drums)": "Dingo 150mm²",
-}
+def multi_select_filter(col, label, df):
+    if col not in df.columns:
+        return ["All"], df
 
-    # LV cables per meter
-conductor_2_keys = {
-    "ABC 2 core x 35mm² + 25mm² bare earth (250m drums)": "ABC 2 core x 35mm² + 25mm² bare earth (250m drums)",
-    "ABC 4 core x 35mm² + 25mm² bare earth (250m drums)": "ABC 4 core x 35mm² + 25mm² bare earth (250m drums)",
-    "ABC 2 core x 35mm² (250m drums)": "ABC 2 core x 50mm² (250m drums)",
-    "ABC 2 core x 50mm² (250m drums)": "ABC 2 core x 50mm² (250m drums)",
-    "ABC 2 core x 95mm² + 50mm² bare earth  (300m drums)": "ABC 2 core x 95mm² + 50mm² bare earth  (300m drums)",
-    "ABC 4 core x 35mm² (250m drums)": "ABC 4 core x 35mm² (250m drums)",
-    "ABC 4 core x 50mm² (250m drums)": "ABC 4 core x 50mm² (250m drums)",
-    "ABC 4 core x 95mm² (250m drums)": "ABC 4 core x 95mm² (250m drums)",
-    "ABC 2 core x 50mm² + 50mm² bare earth  (300m drums)": "ABC 2 core x 50mm² + 50mm² bare earth  (300m drums)",
-    "ABC 4 core x 50mm² + 50mm² bare earth  (300m drums)": "ABC 4 core x 50mm² + 50mm² bare earth  (300m drums)",
-    "ABC 4 core x 95mm² + 50mm² bare earth (300m drums)": "ABC 4 core x 95mm² + 50mm² bare earth (300m drums)",
-    "ABC 2 core x 95mm² + 50mm² bare earth  (300m drums)": "ABC 2 core x 95mm² + 50mm² bare earth  (300m drums)",
-}
+    options = ["All"] + sorted(df[col].dropna().astype(str).unique())
+    selected = st.sidebar.multiselect(label, options, default=["All"])
 
+    if "All" in selected:
+        return selected, df
 
-equipment_keys = {
-    "Noja": "Noja",
-    "0.5 kVa Tx for Noja": "0.5 kVa Tx for Noja",
-    "11kV PMSW (Soule)": "11kV PMSW (Soule)",
-    "11kv ABSW Hookstick Standard": "11kv ABSW Hookstick Standard",
-    "11kv ABSW Hookstick Spring loaded mech": "11kv ABSW Hookstick Spring loaded mech",
-    "33kv ABSW Hookstick Dependant": "33kv ABSW Hookstick Dependant",
-    "11KV FUSE UNIT - C-TYPE": "11KV FUSE UNIT - C-TYPE",
-    "11KV SOLID LINK - C-TYPE": "11KV SOLID LINK - C-TYPE",
-    "11KV OHL ASL C-TYPE RESET 20A 2 SHOT": "11KV OHL ASL C-TYPE RESET 20A 2 SHOT",
-    "11KV OHL ASL C-TYPE RESET 25A 2 SHOT": "11KV OHL ASL C-TYPE RESET 25A 2 SHOT",
-    "11KV OHL ASL C-TYPE RESET 40A 1 SHOT": "11KV OHL ASL C-TYPE RESET 40A 1 SHOT",
-    "11KV OHL ASL C-TYPE RESET 40A 2 SHOT": "11KV OHL ASL C-TYPE RESET 40A 2 SHOT",
-    "11KV OHL ASL C-TYPE RESET 63A 1 SHOT": "11KV OHL ASL C-TYPE RESET 63A 1 SHOT",
-    "11KV OHL ASL C-TYPE RESET 63A 2 SHOT": "11KV OHL ASL C-TYPE RESET 63A 2 SHOT",
-    "11KV OHL ASL C-TYPE RESET 63A 3 SHOT": "11KV OHL ASL C-TYPE RESET 63A 3 SHOT",
-    "11KV OHL ASL C-TYPE RESET 100A 1 SHOT": "11KV OHL ASL C-TYPE RESET 100A 1 SHOT",
-    "11KV OHL ASL C-TYPE RESET 100A 2 SHOT": "11KV OHL ASL C-TYPE RESET 100A 2 SHOT",
-    "11KV OHL ASL C-TYPE RESET 100A 3 SHOT": "11KV OHL ASL C-TYPE RESET 100A 3 SHOT",
-    "11KV FUSE CARRIER - C-TYPE": "11KV FUSE CARRIER - C-TYPE",
-    "11KV OHL FUSE ELEMENT C-TYPE 15A": "11KV OHL FUSE ELEMENT C-TYPE 15A",
-    "11KV OHL FUSE ELEMENT C-TYPE 25A": "11KV OHL FUSE ELEMENT C-TYPE 25A",
-    "11KV OHL FUSE ELEMENT C-TYPE 30A": "11KV OHL FUSE ELEMENT C-TYPE 30A",
-    "11KV OHL FUSE ELEMENT C-TYPE 40A": "11KV OHL FUSE ELEMENT C-TYPE 40A",
-    "11KV OHL FUSE ELEMENT C-TYPE 50A": "11KV OHL FUSE ELEMENT C-TYPE 50A",
-    "11KV OHL ASL - CHEMICAL ACTUATOR": "11KV OHL ASL - CHEMICAL ACTUATOR",
-    "11KV OHL ASL DJP-TYPE 20A 2 SHOT": "11KV OHL ASL DJP-TYPE 20A 2 SHOT",
-    "11KV OHL ASL DJP-TYPE 25A 1 SHOT": "11KV OHL ASL DJP-TYPE 25A 1 SHOT",
-    "11KV OHL ASL DJP-TYPE 25A 2 SHOT": "11KV OHL ASL DJP-TYPE 25A 2 SHOT",
-    "11KV OHL ASL DJP-TYPE 40A 1 SHOT": "11KV OHL ASL DJP-TYPE 40A 1 SHOT",
-    "11KV OHL ASL DJP-TYPE 40A 2 SHOT": "11KV OHL ASL DJP-TYPE 40A 2 SHOT",
-    "11KV OHL ASL DJP-TYPE 63A 1 SHOT": "11KV OHL ASL DJP-TYPE 63A 1 SHOT",
-    "11KV OHL ASL DJP-TYPE 63A 2 SHOT": "11KV OHL ASL DJP-TYPE 63A 2 SHOT",
-    "11KV OHL ASL DJP-TYPE 63A 3 SHOT": "11KV OHL ASL DJP-TYPE 63A 3 SHOT",
-    "11KV OHL ASL DJP-TYPE 100A 1 SHOT": "11KV OHL ASL DJP-TYPE 100A 1 SHOT",
-    "11KV OHL ASL DJP-TYPE 100A 2 SHOT": "11KV OHL ASL DJP-TYPE 100A 2 SHOT",
-    "11KV OHL ASL DJP-TYPE 100A 3 SHOT": "11KV OHL ASL DJP-TYPE 100A 3 SHOT",
-    "11KV OHL FUSE ELEMENT DJP-TYPE 15A": "11KV OHL FUSE ELEMENT DJP-TYPE 15A",
-    "11KV OHL FUSE ELEMENT DJP-TYPE 25A": "11KV OHL FUSE ELEMENT DJP-TYPE 25A",
-    "11KV OHL FUSE ELEMENT DJP-TYPE 30A": "11KV OHL FUSE ELEMENT DJP-TYPE 30A",
-    "11KV OHL FUSE ELEMENT DJP-TYPE 40A": "11KV OHL FUSE ELEMENT DJP-TYPE 40A",
-    "11KV OHL FUSE ELEMENT DJP-TYPE 50A": "11KV OHL FUSE ELEMENT DJP-TYPE 50A",
-}
+    return selected, df[df[col].astype(str).isin(selected)]
 
 
-summary_items = [
-    "Erect Single HV/EHV Pole, up to and including 12 metre pole.",
-    "Erect Section Structure 'H' HV/EHV Pole, up to and including 12 metre pole",
-    "Erect LV Structure Single Pole, up to and including 12 metre pole",
-    "Recover single pole, up to and including 15 metres in height, and reinstate, all ground conditions",
-    "Recover 'A' / 'H' pole, up to and including 15 metres in height, and reinstate, all ground conditions",
-    "Erect 11kV/33kV ABSW.",
-    "Remove 11kV/33kV ABSW",
-    "Noja"
-    "0.5 kVa Tx for Noja"
-    "11kV PMSW (Soule)"
-    "Remove Auto Reclosure",
-    "Erect pole mounted transformer up to 100kVA 1.ph",
-    "Erect pole mounted transformer up to 200kVA 3.p.h",
-    "Remove pole mounted transformer",
-    "Remove platform mounted or 'H' pole mounted transformer",
-    "Install bare conductor, run out, sag, terminate, bind in and connect jumpers; <100mm²",
-    "Install bare conductor, run out, sag, terminate, bind in and connect jumpers; >=100mm² <200mm²",
-    "Install conductor, run out, sag, terminate, clamp in and connect jumpers; 2c + Earth",
-    "Install conductor, run out, sag, terminate, clamp in and connect jumpers; 4c + Earth",
-    "Install service span including connection to mainline & building / structure",
-    "Erect 3.ph fuse units at single tee off pole or in line pole"
-    "Remove 1.ph or 3.ph HV fuses",    
-]
-
-categories = [
-    ("Poles _erected 🪵", pole_erected_keys, "Quantity"),
-    ("Poles _replaced 🪵", poles_replaced_keys, "Quantity"),
-    ("Transformers ⚡🏭", transformer_keys, "Quantity"),
-    ("Conductors", conductor_keys, "Length (Km)"),
-    ("Conductors_2", conductor_2_keys, "Length (Km)"),
-    ("Equipment", equipment_keys, "Quantity"),
-]
-
-column_rename_map = {
-    "mapped": "Output",
-    "segmentcode": "Circuit",
-    "datetouse_display": "Date",
-    "qty": "Quantity_original",
-    "qsub": "Quantity_used",
-    "segmentdesc": "Segment",
-    "shire": "District",
-    "pid_ohl_nr": "PID",
-    "projectmanager": "Project Manager"
-}
 
-export_columns = [
-    'Output','comment', 'item', 'Quantity_original','Quantity_used', 'material_code','type', 'pole', 'Date',
-    'District', 'project', 'Project Manager','location_map', 'Circuit', 'Segment',
-    'team lider', 'PID', 'sourcefile'
-]
+# Normalized Master cache on disk; bump the version whenever prepare_dataframe changes
+CACHE_DIR = os.environ.get("GAELTEC_CACHE_DIR", ".cache")
+NORMALIZED_SCHEMA_VERSION = 5
 
 # --- Gradient background ---
 gradient_bg = """
@@ -787,10 +438,11 @@ st.header("Upload Data Files")
 # -------------------------------
 # Load Aggregated Parquet
 # -------------------------------
-master_file = st.file_uploader(
-    "Upload Master.parquet",
+master_files = st.file_uploader(
+    "Upload Master.parquet (or one parquet per project)",
     type=["parquet"],
-    key="master"
+    key="master",
+    accept_multiple_files=True
 )
 
 resume_file = st.file_uploader(
@@ -801,8 +453,7 @@ resume_file = st.file_uploader(
 resume_df = None
 
 if resume_file is not None:
-    resume_df = pd.read_parquet(resume_file)
-    resume_df.columns = resume_df.columns.str.strip().str.lower()
+    resume_df = read_parquet_columns(resume_file.getvalue())
 
 misc_file = st.file_uploader(
     "Upload miscellaneous.parquet",
@@ -813,70 +464,118 @@ misc_df = None
 
 if misc_file is not None:
     try:
-        misc_df = pd.read_parquet(misc_file)
-        misc_df.columns = misc_df.columns.str.strip().str.lower()
+        misc_df = read_parquet_columns(misc_file.getvalue(), MISC_COLUMNS)
     except Exception as e:
         st.warning(f"Could not load Miscellaneous parquet: {e}")
 
 base_df = None
 st.header("Upload Data Files")
 
-agg_view = None
-
-if master_file is not None:
-    df = pd.read_parquet(master_file)
-    df.columns = df.columns.str.strip().str.lower()  # normalize columns
-
-    if 'datetouse' in df.columns:
-        df['datetouse_dt'] = pd.to_datetime(df['datetouse'], errors='coerce')
-        df['datetouse_display'] = df['datetouse_dt'].dt.strftime("%d/%m/%Y")
-        df.loc[df['datetouse_dt'].isna(), 'datetouse_display'] = "Unplanned"
-        df['datetouse_dt'] = df['datetouse_dt'].dt.normalize()
-    else:
-        df['datetouse_dt'] = pd.NaT
-        df['datetouse_display'] = "Unplanned"
-
-    agg_view = df.copy()
-
 # -------------------------------
 # Date Source Selector
 # -------------------------------
 date_source = st.sidebar.radio(
     "Select Date Source",
-    ["Planned + Done (datetouse)", "Done Only (done)"]
+    list(DATE_SOURCES)
 )
 
 # -------------------------------
-# --- Team Filter (GLOBAL) ---
+# Streaming mode (very large masters)
 # -------------------------------
-base_df = None
+streaming_mode = st.sidebar.checkbox(
+    "Streaming mode (large Master.parquet)",
+    help="Aggregate the master one row group at a time instead of loading it into memory."
+)
+
+# -------------------------------
+# Export format for row-level downloads
+# -------------------------------
+export_format = st.sidebar.selectbox(
+    "Row export format",
+    ["xlsx"] + list(COLUMNAR_FORMATS),
+    format_func={"xlsx": "Excel (branded)", "csv": "CSV", "parquet": "Parquet", "arrow": "Arrow IPC"}.get,
+    help="CSV / Parquet / Arrow are written straight from Arrow and are much faster for large selections."
+)
 
-if master_file:
-    base_df = pd.read_parquet(master_file)
-    base_df.columns = base_df.columns.str.strip().str.lower()
+if master_files and streaming_mode:
+    st.sidebar.header("Filter Options")
+    master_sources = file_sources(master_files)
 
-    # Normalize date
-    if date_source == "Planned + Done (datetouse)":
-        if 'datetouse' in base_df.columns:
-            base_df['datetouse_dt'] = pd.to_datetime(base_df['datetouse'], errors='coerce').dt.normalize()
-        else:
-            base_df['datetouse_dt'] = pd.NaT
-    elif date_source == "Done Only (done)":
-        if 'done' in base_df.columns:
-            base_df['datetouse_dt'] = pd.to_datetime(base_df['done'], errors='coerce').dt.normalize()
-        else:
-            base_df['datetouse_dt'] = pd.NaT
-
-    # Normalize numeric columns
-    for col in ['total', 'orig']:
-        if col in base_df.columns:
-            base_df[col] = (
-                base_df[col]
-                .astype(str)
-                .str.replace(" ", "")
-                .str.replace(",", ".", regex=False)
-            )
-            base_df[col] = pd.to_numeric(base_df[col], errors='coerce')
+    # Option lists come from streaming the two filter columns only, once per upload
+    stream_options = stream_filter_options(files_digest(master_files), master_files)
+
+    stream_shires = st.sidebar.multiselect("Select Shire", stream_options['shire'])
+    stream_projects = st.sidebar.multiselect("Select Project", stream_options['project'])
+    stream_start = st.sidebar.date_input("Start date", pd.Timestamp.today().replace(month=1, day=1))
+    stream_end = st.sidebar.date_input("End date")
+
+    stream_spec = (
+        ('shires', tuple(stream_shires)),
+        ('projects', tuple(stream_projects)),
+        ('date_column', DATE_SOURCES[date_source]),
+        ('start', stream_start),
+        ('end', stream_end),
+    )
+    aggregates = streamed_aggregates(files_digest(master_files), master_files, stream_spec)
+
+    formatted_total = f"{aggregates['total']:,.2f}".replace(",", " ").replace(".", ",")
+    formatted_variation = f"{aggregates['variation']:,.2f}".replace(",", " ").replace(".", ",")
+    st.markdown("<h2>Financial</h2>", unsafe_allow_html=True)
+    st.markdown(
+        f"<h2 style='color:#32CD32; text-align:center;'><b>Total:</b> {formatted_total} "
+        f"&nbsp; <b>Variation:</b> {formatted_variation}</h2>"
+        f"<p style='text-align:center;'>({aggregates['rows']:,} rows, {stream_start} → {stream_end})</p>",
+        unsafe_allow_html=True
+    )
+
+    if aggregates['revenue'] is not None and not aggregates['revenue'].empty:
+        revenue_df = aggregates['revenue'].sort_index().rename_axis('datetouse_dt').reset_index(name='total')
+        fig = px.line(revenue_df, x='datetouse_dt', y='total', markers=True)
+        fig.update_layout(
+            height=500,
+            xaxis_title="Date",
+            yaxis_title="Revenue (£)",
+            plot_bgcolor='rgba(0,0,0,0)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            font=dict(color='white')
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("No data for selected filters.")
+
+    st.header("🪵 Materials")
+    for cat_name, _, y_label in categories:
+        bar_series = aggregates['materials'].get(cat_name)
+        if bar_series is None or bar_series.empty:
+            st.info(f"No data found for {cat_name}")
+            continue
+        bar_data = bar_series.rename_axis('Mapped').reset_index(name='Total')
+        st.subheader(f"🔹 {cat_name} — Total: {bar_data['Total'].sum():,.2f}")
+        fig = px.bar(bar_data, x='Mapped', y='Total', labels={'Mapped': 'Mapping', 'Total': y_label})
+        fig.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)')
+        st.plotly_chart(fig, use_container_width=True)
+
+        with st.expander("🔍 Drill-down", expanded=False):
+            selected_mapping = st.selectbox("Mapping", bar_data['Mapped'].astype(str).tolist(), key=f"stream_{cat_name}")
+            if st.button("Load rows", key=f"stream_rows_{cat_name}"):
+                drill_df = stream_rows(stream_batches(master_sources, dict(stream_spec)), cat_name, selected_mapping)
+                st.dataframe(drill_df, use_container_width=True)
+                st.write(f"**Total records:** {len(drill_df)}")
+
+    st.stop()
+
+# -------------------------------
+# --- Team Filter (GLOBAL) ---
+# -------------------------------
+if master_files:
+    # Parsed once per upload; reruns hit the cache until a different file arrives
+    master_digest = files_digest(master_files)
+    master_df = load_master(master_digest, master_files)
+
+    # Indexes and rollups for both date bases are prebuilt; the radio just picks one
+    date_views = load_date_views(master_digest, master_df)
+    date_view = date_views['views'][date_source]
+    base_df = master_df
 
 # Stop early if no data
 if base_df is None:
@@ -888,25 +587,61 @@ if base_df is None:
 # -------------------------------
 st.sidebar.header("Filter Options")
 
-def multiselect_filter(df, column, label):
-    if column not in df.columns:
-        return ["All"], df
-    options = ["All"] + sorted(df[column].dropna().astype(str).unique())
+def multiselect_filter(mask, column, label):
+    # Options come from the rows surviving the previous filters; applying is a bitmap AND
+    entry = filter_index.get(column)
+    if entry is None:
+        return ["All"], mask
+    options = ["All"] + index_options(entry, mask)
     selected = st.sidebar.multiselect(label, options, default=["All"])
     if "All" not in selected:
-        df = df[df[column].astype(str).isin(selected)]
-    return selected, df
-
-filtered_df = base_df.copy()
-
-selected_shire, filtered_df = multiselect_filter(filtered_df, 'shire', "Select Shire")
-selected_project, filtered_df = multiselect_filter(filtered_df, 'project', "Select Project")
-selected_pm, filtered_df = multiselect_filter(filtered_df, 'projectmanager', "Select Project Manager")
-selected_segment, filtered_df = multiselect_filter(filtered_df, 'segmentcode', "Select Segment Code")
-selected_pole, filtered_df = multiselect_filter(filtered_df, 'pole', "Select Pole")
-selected_type, filtered_df = multiselect_filter(filtered_df, 'type', "Select Type")
-selected_team, filtered_df = multiselect_filter(filtered_df, 'team_name', "Select Team")
-
+        mask = mask & index_mask(entry, selected, len(mask))
+    return selected, mask
+
+filter_index = date_views['filter_index']
+date_index = date_view['date_index']
+rollup_cube = date_view['cube']
+cube_date_index = date_view['cube_date_index']
+row_mask = np.ones(len(base_df), dtype=bool)
+
+selected_shire, row_mask = multiselect_filter(row_mask, 'shire', "Select Shire")
+selected_project, row_mask = multiselect_filter(row_mask, 'project', "Select Project")
+selected_pm, row_mask = multiselect_filter(row_mask, 'projectmanager', "Select Project Manager")
+selected_segment, row_mask = multiselect_filter(row_mask, 'segmentcode', "Select Segment Code")
+selected_pole, row_mask = multiselect_filter(row_mask, 'pole', "Select Pole")
+selected_type, row_mask = multiselect_filter(row_mask, 'type', "Select Type")
+selected_team, row_mask = multiselect_filter(row_mask, 'team_name', "Select Team")
+
+def rows_in(start, stop):
+    # Date range is a positional slice; the sidebar bitmap only filters inside it
+    order = date_view['order']
+    if order is None:
+        mask = row_mask[start:stop]
+        rows = base_df.iloc[start:stop]
+        return rows if mask.all() else rows[mask]
+
+    # Other date basis: slice its sort permutation and expose that date as datetouse_dt
+    positions = order[start:stop]
+    rows = base_df.take(positions[row_mask[positions]])
+    return rows.assign(datetouse_dt=rows[date_view['date_column']])
+
+def rollup_in(start, stop):
+    # Pole / type aren't cube dimensions: roll up the filtered rows instead
+    if "All" not in selected_pole or "All" not in selected_type:
+        return build_rollup_cube(filtered_df)
+    cube = rollup_cube.iloc[start:stop]
+    for column, selected in cube_selections.items():
+        if "All" not in selected and column in cube.columns:
+            cube = cube[cube[column].isin(selected)]
+    return cube
+
+cube_selections = {
+    'shire': selected_shire,
+    'project': selected_project,
+    'projectmanager': selected_pm,
+    'segmentcode': selected_segment,
+    'team_name': selected_team,
+}
 
 # -------------------------------
 # Date Filter
@@ -917,63 +652,58 @@ filter_type = st.sidebar.selectbox(
 )
 
 date_range_str = ""
-filtered_df['datetouse_dt'] = pd.to_datetime(filtered_df['datetouse_dt'])
 
 if filter_type == "Unplanned":
-    filtered_df = filtered_df[filtered_df['datetouse_dt'].isna()]
+    filtered_df = rows_in(date_index['n_dated'], len(base_df))
+    rollup_df = rollup_in(cube_date_index['n_dated'], len(rollup_cube))
     date_range_str = "Unplanned"
 
 else:
-    filtered_df = filtered_df[filtered_df['datetouse_dt'].notna()]
+    date_bounds = None  # (unit, first, last) → whole dated block when unset
 
     if filter_type == "Single Day":
         d = st.sidebar.date_input("Select date")
-        filtered_df = filtered_df[filtered_df['datetouse_dt'] == pd.Timestamp(d)]
+        date_bounds = ('D', d, d)
         date_range_str = str(d)
 
     elif filter_type == "Week":
         start = pd.Timestamp(st.sidebar.date_input("Week start"))
         end = start + pd.Timedelta(days=6)
-        filtered_df = filtered_df[
-            (filtered_df['datetouse_dt'] >= start) &
-            (filtered_df['datetouse_dt'] <= end)
-        ]
+        date_bounds = ('D', start, end)
         date_range_str = f"{start} → {end}"
 
     elif filter_type == "Month":
         d = st.sidebar.date_input("Pick any date in month")
-        filtered_df = filtered_df[
-            (filtered_df['datetouse_dt'].dt.month == d.month) &
-            (filtered_df['datetouse_dt'].dt.year == d.year)
-        ]
+        date_bounds = ('M', d, d)
         date_range_str = d.strftime("%B %Y")
 
     elif filter_type == "Year":
         y = st.sidebar.number_input("Year", 2000, 2100, 2025)
-        filtered_df = filtered_df[filtered_df['datetouse_dt'].dt.year == y]
+        year_start = pd.Timestamp(year=int(y), month=1, day=1)
+        date_bounds = ('Y', year_start, year_start)
         date_range_str = str(y)
 
     elif filter_type == "Custom Range":
         start = pd.Timestamp(st.sidebar.date_input("Start date"))
         end = pd.Timestamp(st.sidebar.date_input("End date"))
-        filtered_df = filtered_df[
-            (filtered_df['datetouse_dt'] >= start) &
-            (filtered_df['datetouse_dt'] <= end)
-        ]
+        date_bounds = ('D', start, end)
         date_range_str = f"{start} → {end}"
 
+    if date_bounds is None:
+        filtered_df = rows_in(0, date_index['n_dated'])
+        rollup_df = rollup_in(0, cube_date_index['n_dated'])
+    else:
+        filtered_df = rows_in(*date_rows(date_index, *date_bounds))
+        rollup_df = rollup_in(*date_rows(cube_date_index, *date_bounds))
+
     # -------------------------------
     # --- Total & Variation Display ---
     # -------------------------------
     total_sum, variation_sum = 0, 0
     if 'total' in filtered_df.columns:
-        total_series = pd.to_numeric(filtered_df['total'].astype(str).str.replace(" ", "").str.replace(",", ".", regex=False),
-                                     errors='coerce')
-        total_sum = total_series.sum(skipna=True)
+        total_sum = rollup_df['total'].sum()
         if 'orig' in filtered_df.columns:
-            orig_series = pd.to_numeric(filtered_df['orig'].astype(str).str.replace(" ", "").str.replace(",", ".", regex=False),
-                                        errors='coerce')
-            variation_sum = (total_series - orig_series).sum(skipna=True)
+            variation_sum = rollup_df['variation'].sum()
 
     formatted_total = f"{total_sum:,.2f}".replace(",", " ").replace(".", ",")
     formatted_variation = f"{variation_sum:,.2f}".replace(",", " ").replace(".", ",")
@@ -1011,6 +741,14 @@ else:
         )
     except Exception as e:
         st.warning(f"Could not display Total & Variation: {e}")
+
+# Everything filtered_df / rollup_df depend on; exports are cached under it
+filter_state = (
+    master_digest, date_source, filter_type, date_range_str,
+    tuple(tuple(sel) for sel in [selected_shire, selected_project, selected_pm, selected_segment,
+                                 selected_pole, selected_type, selected_team]),
+)
+
 # -------------------------------
 # Revenue Over Time
 # -------------------------------
@@ -1021,7 +759,7 @@ general_summary = pd.DataFrame(
 if not filtered_df.empty and 'datetouse_dt' in filtered_df.columns and 'total' in filtered_df.columns:
     # Aggregate revenue per date
     revenue_df = (
-        filtered_df
+        rollup_df
         .dropna(subset=['datetouse_dt'])
         .groupby('datetouse_dt', as_index=False)['total']
         .sum()
@@ -1070,346 +808,37 @@ else:
     st.info("No data for selected filters.")
 
 if filtered_df is not None and not filtered_df.empty:
-    buffer_agg = BytesIO()
-
-    with pd.ExcelWriter(buffer_agg, engine="openpyxl") as writer:
-
-        # ---- Prepare export_df ----
-        export_df = filtered_df.copy()
-        export_df = export_df.rename(columns=column_rename_map)
-
-        if "done" in export_df.columns:
-            export_df["done"] = pd.to_datetime(export_df["done"], errors="coerce")
-            export_df["done_display"] = export_df["done"].dt.strftime("%d/%m/%Y")
-            export_df.loc[export_df["done"].isna(), "done"] = "Unplanned"
-
-        cols_to_include = [
-            "item","comment", "Quantity_original", "Quantity_used", "material_code",
-            "type", "pole", "datetouse_dt", "District", "project",
-            "Project Manager","location_map", "Circuit", "Segment",
-            "team lider","total", "PID", "sourcefile"
-        ]
-        cols_to_include = [c for c in cols_to_include if c in export_df.columns]
-        export_df = export_df[cols_to_include]
-
-        # ---- Output sheet (start below images) ----
-        export_df.to_excel(writer, sheet_name="Output", index=False, startrow=1)
-        ws = writer.book["Output"]
-
-        # ---- Summary sheet ----
-        if "Quantity_used" in export_df.columns:
-
-            # Ensure numeric
-            export_df["Quantity_used"] = pd.to_numeric(export_df["Quantity_used"], errors="coerce").fillna(0)
-
-            # Normalize items
-            export_df["item_norm"] = export_df["item"].apply(normalize_item)
-
-            # Normalize key lists
-            erect_norm = [normalize_item(i) for i in pole_erected_keys]
-            recover_norm = [normalize_item(i) for i in poles_replaced_keys]
-            conductor_hv_norm = [normalize_item(i) for i in conductor_keys]
-            conductor_lv_norm = [normalize_item(i) for i in conductor_2_keys]
-
-            # Transformer mappings
-            tx_1ph_keys = [
-                normalize_item("Transformer 1ph 50kVA"),
-                normalize_item("Transformer 1ph 100kVA"),
-                normalize_item("Transformer 1ph 25kVA"),
-            ]
-
-            tx_3ph_keys = [
-                normalize_item("Transformer 3ph 50kVA"),
-                normalize_item("Transformer 3ph 200kVA"),
-                normalize_item("Transformer 3ph 100kVA"),
-            ]
-
-            # --- Build summary per project ---
-            summary_rows = []
-
-            for project, df_proj in export_df.groupby("project"):
-
-                # ERECT POLES
-                erect_poles = df_proj[df_proj["item_norm"].isin(erect_norm)]["Quantity_used"].sum()
-
-                # RECOVER POLES
-                recover_poles = df_proj[df_proj["item_norm"].isin(recover_norm)]["Quantity_used"].sum()
-
-                # POLES REFURB (not erect and not recover, but pole-related)
-                pole_series = df_proj["pole"].dropna().astype(str).str.strip()
-                # Unique poles in project
-                all_poles_set = set(pole_series)
-
-                # Poles used in Erect
-                erect_poles_set = set(
-                    df_proj[df_proj["item_norm"].isin(erect_norm)]["pole"]
-                    .dropna()
-                    .astype(str)
-                    .str.strip()
-                )
-
-                # Poles used in Recover
-                recover_poles_set = set(
-                    df_proj[df_proj["item_norm"].isin(recover_norm)]["pole"]
-                    .dropna()
-                    .astype(str)
-                    .str.strip()
-                )
-
-                # Poles Refurb = poles NOT in Erect nor Recover
-                refurb_poles_set = all_poles_set - erect_poles_set - recover_poles_set
-                poles_refurb = len(refurb_poles_set)
-
-                # TRANSFORMERS
-                pte_1ph = df_proj[df_proj["item_norm"].isin(tx_1ph_keys)]["Quantity_used"].sum()
-                pte_3ph = df_proj[df_proj["item_norm"].isin(tx_3ph_keys)]["Quantity_used"].sum()
-
-                # CONDUCTORS
-                conductor_hv = df_proj[df_proj["item_norm"].isin(conductor_hv_norm)]["Quantity_used"].sum()
-                conductor_lv = df_proj[df_proj["item_norm"].isin(conductor_lv_norm)]["Quantity_used"].sum()
-                # --- NEW TASK COLUMNS ---
-                noja_keys = [normalize_item("Noja"), normalize_item("0.5 kVa Tx for Noja")]
-                soule_keys = [normalize_item("11kV PMSW (Soule)")]
-                absw_keys = [
-                    normalize_item("11kv ABSW Hookstick Standard"),
-                    normalize_item("11kv ABSW Hookstick Spring loaded mech"),
-                    normalize_item("33kv ABSW Hookstick Dependant")
-                ]
-                fuse_11kv_keys = [
-                    normalize_item("Erect 3.ph fuse units at single tee off pole or in line pole."),
-                    normalize_item("Erect 1.ph fuse units at single tee off pole or in line pole.")
-                ]
-
-                noja_sum = df_proj[df_proj["item_norm"].isin(noja_keys)]["Quantity_used"].sum()
-                soule_sum = df_proj[df_proj["item_norm"].isin(soule_keys)]["Quantity_used"].sum()
-                absw_sum = df_proj[df_proj["item_norm"].isin(absw_keys)]["Quantity_used"].sum()
-                fuse_11kv_sum = df_proj[df_proj["item_norm"].isin(fuse_11kv_keys)]["Quantity_used"].sum()
-
-                # VALUE (if exists)
-                if "total" in df_proj.columns:
-                    total_value = pd.to_numeric(df_proj["total"], errors="coerce").fillna(0).sum()
-                else:
-                    total_value = 0
-
-                summary_rows.append({
-                    "Project": project,
-                    "Erect Poles": erect_poles,
-                    "Recover Poles": recover_poles,
-                    "Poles Refurb": poles_refurb,
-                    "PTE Installed 1ph": pte_1ph,
-                    "PTE Installed 3ph": pte_3ph,
-                    "Conductor HV Installed (Km)": conductor_hv,
-                    "Conductor LV Installed (Km)": conductor_lv,
-                    "Noja": noja_sum,
-                    "Soule": soule_sum,
-                    "ABSW": absw_sum,
-                    "11 kV fuse": fuse_11kv_sum,
-                    "Total Value (£)": total_value
-                })
-
-            # Create DataFrame
-            final_summary = pd.DataFrame(summary_rows)
-
-            # Sort by project
-            final_summary = final_summary.sort_values("Project")
-
-            # Write to Excel
-            # --- Add Total Row ---
-            total_row = final_summary.select_dtypes(include='number').sum().to_dict()
-            total_row["Project"] = "Total"  # Label for the total row
-
-            # Append total row
-            final_summary = pd.concat([final_summary, pd.DataFrame([total_row])], ignore_index=True)
-            final_summary.to_excel(writer, sheet_name="Summary", index=False, startrow=1)
-            ws_summary = writer.book["Summary"]
-
-
-        # ---- Breakdown sheets per summary column ----
-            breakdown_columns = {
-                "Erect Poles": erect_norm,
-                "Recover Poles": recover_norm,
-                "Poles Refurb": None,  # Special logic
-                "PTE Installed 1ph": tx_1ph_keys,
-                "PTE Installed 3ph": tx_3ph_keys,
-                "Conductor HV Installed (Km)": conductor_hv_norm,
-                "Conductor LV Installed (Km)": conductor_lv_norm,
-                "Noja": noja_keys,
-                "Soule": soule_keys,
-                "ABSW": absw_keys,
-                "11 kV fuse": fuse_11kv_keys,
-            }
-
-            for col_name, keys in breakdown_columns.items():
-                sheet_name = col_name[:31]  # Excel sheet name max 31 chars
-
-                if col_name == "Poles Refurb":
-                    # Poles NOT in Erect or Recover
-                    all_poles_set = set(export_df["pole"].dropna().astype(str).str.strip())
-                    erect_poles_set = set(export_df[export_df["item_norm"].isin(erect_norm)]["pole"].dropna().astype(str).str.strip())
-                    recover_poles_set = set(export_df[export_df["item_norm"].isin(recover_norm)]["pole"].dropna().astype(str).str.strip())
-                    refurb_poles_set = all_poles_set - erect_poles_set - recover_poles_set
-                    df_breakdown = export_df[export_df["pole"].isin(refurb_poles_set)]
-                else:
-                    df_breakdown = export_df[export_df["item_norm"].isin(keys)]
-
-                # Columns to include
-                cols_to_include = [
-                    "item","comment","Quantity_used","material_code","pole","datetouse_dt","done_display",
-                    "District", "project","Project Manager","location_map","Circuit","Segment"
-                ]
-                cols_to_include = [c for c in cols_to_include if c in df_breakdown.columns]
-                df_breakdown = df_breakdown[cols_to_include]
-
-                # Write sheet
-                df_breakdown.to_excel(writer, sheet_name=sheet_name, index=False, startrow=1)
-                ws_break = writer.book[sheet_name]
-
-                # ---- Formatting ----
-                ws_break.row_dimensions[1].height = 90  # logo row
-
-                # Logos
-                img1_b = XLImage("Images/GaeltecImage.png")
-                img2_b = XLImage("Images/SPEN.png")
-                IMG_HEIGHT = 120
-                IMG_WIDTH_SMALL = 120
-                IMG_WIDTH_LARGE = IMG_WIDTH_SMALL * 3
-
-                img1_b.width = IMG_WIDTH_SMALL
-                img1_b.height = IMG_HEIGHT
-                img1_b.anchor = "B1"
-
-                img2_b.width = IMG_WIDTH_LARGE
-                img2_b.height = IMG_HEIGHT
-                img2_b.anchor = "A1"
-
-                ws_break.add_image(img1_b)
-                ws_break.add_image(img2_b)
-
-                # Header style
-                header_font = Font(bold=True, size=16)
-                header_fill = PatternFill(start_color="00CCFF", end_color="00CCFF", fill_type="solid")
-                thin_side = Side(style="thin")
-                medium_side = Side(style="medium")
-                thick_side = Side(style="thick")
-                light_grey_fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
-                white_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
-
-                max_col = ws_break.max_column
-                max_row = ws_break.max_row
-
-                # HEADER → ROW 2
-                for col_idx, cell in enumerate(ws_break[2], start=1):
-                    cell.font = header_font
-                    cell.fill = header_fill
-                    ws_break.column_dimensions[get_column_letter(col_idx)].width = 60 if col_idx == 1 else 20
-                    cell.border = Border(
-                        left=thick_side if col_idx == 1 else medium_side,
-                        right=thick_side if col_idx == max_col else medium_side,
-                        top=thick_side,
-                        bottom=thick_side
-                    )
-
-                # DATA ROWS → START ROW 3
-                for row_idx in range(3, max_row + 1):
-                    fill = light_grey_fill if row_idx % 2 == 1 else white_fill
-                    for col_idx in range(1, max_col + 1):
-                        cell = ws_break.cell(row=row_idx, column=col_idx)
-                        cell.fill = fill
-                        cell.border = Border(
-                            left=thin_side,
-                            right=thin_side,
-                            top=thin_side,
-                            bottom=thin_side
-                        )
-                        
-        # ---- Formatting styles ----
-        header_font = Font(bold=True, size=16)
-        header_fill = PatternFill(start_color="00CCFF", end_color="00CCFF", fill_type="solid")
-        thin_side = Side(style="thin")
-        medium_side = Side(style="medium")
-        thick_side = Side(style="thick")
-        light_grey_fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
-        white_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
-
-        # AFTER ✅
-        for sheet in [ws, ws_summary]:
-            sheet.row_dimensions[1].height = 90   # logo row
-
-        # ---- Load & resize images ----
-        IMG_HEIGHT = 120
-        IMG_WIDTH_SMALL = 120
-        IMG_WIDTH_LARGE = IMG_WIDTH_SMALL * 3  # 🔹 3× wider
-
-        img1 = XLImage("Images/GaeltecImage.png")
-        img2 = XLImage("Images/SPEN.png")
-
-        img1.width = IMG_WIDTH_SMALL
-        img1.height = IMG_HEIGHT
-
-        img2.width = IMG_WIDTH_LARGE
-        img2.height = IMG_HEIGHT
-
-        # Position images (row 1)
-        img1.anchor = "B1"
-        img2.anchor = "A1"
-
-        ws.add_image(img1)
-        ws.add_image(img2)
-
-        # Same for Summary
-        img1_s = XLImage("Images/GaeltecImage.png")
-        img2_s = XLImage("Images/SPEN.png")
-
-        img1_s.width = IMG_WIDTH_SMALL
-        img1_s.height = IMG_HEIGHT
-        img1_s.anchor = "A1"
-
-        img2_s.width = IMG_WIDTH_LARGE
-        img2_s.height = IMG_HEIGHT
-        img2_s.anchor = "B1"
-
-        ws_summary.add_image(img1_s)
-        ws_summary.add_image(img2_s)
-
-
-        # ---- Formatting (unchanged style) ----
-        for sheet in [ws, ws_summary]:
-            max_col = sheet.max_column
-            max_row = sheet.max_row
-
-            # HEADER → ROW 2 ✅
-            for col_idx, cell in enumerate(sheet[2], start=1):
-                cell.font = header_font
-                cell.fill = header_fill
-                sheet.column_dimensions[get_column_letter(col_idx)].width = 60 if col_idx == 1 else 20
-                cell.border = Border(
-                    left=thick_side if col_idx == 1 else medium_side,
-                    right=thick_side if col_idx == max_col else medium_side,
-                    top=thick_side,
-                    bottom=thick_side
-                )
+    frame_download(
+        "(Output Details)",
+        export_key(filter_state, "output"),
+        partial(build_output_workbook, filtered_df),
+        partial(output_details_frame, filtered_df),
+        file_stem="Gaeltec_Output",
+    )
 
-            # DATA ROWS → START ROW 3 ✅
-            for row_idx in range(3, max_row + 1):
-                fill = light_grey_fill if row_idx % 2 == 1 else white_fill
-                for col_idx in range(1, max_col + 1):
-                    cell = sheet.cell(row=row_idx, column=col_idx)
-                    cell.fill = fill
-                    cell.border = Border(
-                        left=thin_side,
-                        right=thin_side,
-                        top=thin_side,
-                        bottom=thin_side
-                    )
+    # All export columns of the filtered rows; columnar formats only (no branded layout)
+    if export_format != "xlsx":
+        ext, mime = COLUMNAR_FORMATS[export_format]
+        export_download(
+            f"📥 Download {ext.upper()} (Filtered rows)",
+            export_key(filter_state, "rows", export_format),
+            lambda filtered_df=filtered_df, export_format=export_format: columnar_export(build_export_df(filtered_df), export_format),
+            file_name=f"Gaeltec_Rows.{ext}",
+            mime=mime,
+        )
 
-    # ---- Download button ----
-    buffer_agg.seek(0)
-    st.download_button(
-        label="📥 Download Excel (Output Details)",
-        data=buffer_agg,
-        file_name="Gaeltec_Output.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+    # ---- Per-project / per-PM packs (Output workbook + Work Instructions) as one ZIP ----
+    bundle_by = st.selectbox("Bundle packs by", ["projectmanager", "project"],
+                             format_func={"projectmanager": "Project Manager", "project": "Project"}.get)
+    if bundle_by in filtered_df.columns:
+        export_download(
+            f"📦 Download packs per {bundle_by} (ZIP)",
+            export_key(filter_state, "bundle", bundle_by, misc_file and file_digest(misc_file)),
+            lambda filtered_df=filtered_df, bundle_by=bundle_by, misc_df=misc_df: bundle_zip(
+                partition_frames(filtered_df, bundle_by), misc_df, max_workers=BUNDLE_WORKERS),
+            file_name=f"Gaeltec_packs_{bundle_by}_{date_range_str}.zip",
+            mime="application/zip",
+        )
 
 else:
     st.info("Project or Segment Code columns not found in the data.")
@@ -1419,9 +848,9 @@ else:
 # -------------------------------
 if {'datetouse_dt','done', 'team_name', 'total'}.issubset(filtered_df.columns):
     team_df = (
-        filtered_df
+        rollup_df
         .dropna(subset=['datetouse_dt', 'team_name'])
-        .groupby(['datetouse_dt', 'team_name'], as_index=False)['total']
+        .groupby(['datetouse_dt', 'team_name'], as_index=False, observed=True)['total']
         .sum()
     )
 
@@ -1439,43 +868,14 @@ if {'datetouse_dt','done', 'team_name', 'total'}.issubset(filtered_df.columns):
     # -------------------------------
     # Revenue per Project (Excel Export)
     # -------------------------------
-    if not filtered_df.empty and 'project' in filtered_df.columns and 'total' in filtered_df.columns:
-        revenue_per_project = (
-            filtered_df
-            .groupby('project', as_index=False)['total']
-            .sum()
-            .sort_values('total', ascending=False)
-       )
-
-        revenue_per_project.rename(
-            columns={'total': 'Revenue (£)'},
-            inplace=True
-        )
-    else:
-        revenue_per_project = pd.DataFrame()
-    
-    if not filtered_df.empty and 'team_name' in filtered_df.columns and 'total' in filtered_df.columns:
-        revenue_per_team = (
-            filtered_df
-            .groupby('team_name', as_index=False)['total']
-            .sum()
-            .sort_values('total', ascending=False)
-        )
-
-        revenue_per_team.rename(
-            columns={'team_name': 'Team', 'total': 'Revenue (£)'},
-            inplace=True
-        )
-    else:
-        revenue_per_team = pd.DataFrame()
+    revenue_per_project, revenue_per_team = revenue_tables(rollup_df)
 
     if not revenue_per_project.empty or not revenue_per_team.empty:
-        excel_file = to_excel(revenue_per_project, revenue_per_team)
-        st.download_button(
-            label="📥 Download Revenue Summary (Excel)",
-            data=excel_file,
+        export_download(
+            "📥 Download Revenue Summary (Excel)",
+            export_key(filter_state, "revenue"),
+            partial(to_excel, revenue_per_project, revenue_per_team),
             file_name=f"revenue_summary_{date_range_str}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
     else:
         st.info("No revenue data available for export.")
@@ -1490,7 +890,12 @@ if {'datetouse_dt','done', 'team_name', 'total'}.issubset(filtered_df.columns):
             if 'filtered_df' in locals() and not filtered_df.empty and 'project' in filtered_df.columns:
                 
                 # Count projects and get top projects
-                project_counts = filtered_df['project'].value_counts().reset_index()
+                project_counts = (
+                    rollup_df
+                    .groupby('project', as_index=False, observed=True)['rows']
+                    .sum()
+                    .sort_values('rows', ascending=False)
+                )
                 project_counts.columns = ['Project', 'total']
                 
                 # If too many projects, group smaller ones into "Other"
@@ -1578,14 +983,12 @@ if {'datetouse_dt','done', 'team_name', 'total'}.issubset(filtered_df.columns):
 
 # ---- Streamlit download button ----
     if 'filtered_df' in locals() and not filtered_df.empty:
-        excel_file = generate_excel_styled_multilevel(
-            filtered_df,
-            poles_df if 'poles_df' in locals() else None)
-        st.download_button(
-            label="📥 High level planning & Poles Excel",
-            data=excel_file,
+        # Works (poles) data is only built further down, so the Poles sheet stays empty here
+        export_download(
+            "📥 High level planning & Poles Excel",
+            export_key(filter_state, "planning"),
+            partial(generate_excel_styled_multilevel, filtered_df),
             file_name=f"High level planning_{date_range_str}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
         
     # -------------------------------
@@ -1594,34 +997,31 @@ if {'datetouse_dt','done', 'team_name', 'total'}.issubset(filtered_df.columns):
     col_map, col_desc = st.columns([2, 1])
     with col_map:
         st.header("🗺️ Regional Map View")
-        folder_path = r"Maps"
-        file_list = glob.glob(os.path.join(folder_path, "*.json"))
+        area_store, ward_index = geometry_store()
 
-        if not file_list:
-            st.error(f"No JSON files found in folder: {folder_path}")
+        if area_store.empty:
+            st.error(f"No JSON files found in folder: {MAPS_DIR}")
         else:
-            gdf_list = [gpd.read_file(file) for file in file_list]
-            combined_gdf = gpd.GeoDataFrame(pd.concat(gdf_list, ignore_index=True), crs=gdf_list[0].crs)
-
-            if "location_map" in filtered_df.columns:
-                active_regions = filtered_df["location_map"].dropna().unique().tolist()
-                wards_to_select = []
-                for region in active_regions:
-                    if region in mapping_region:
-                        wards_to_select.extend(mapping_region[region])
-                    else:
-                        wards_to_select.append(region)
-                wards_to_select = list(set(wards_to_select))
-                areas_of_interest = combined_gdf[combined_gdf["WD13NM"].isin(wards_to_select)]
-            else:
-                areas_of_interest = pd.DataFrame()
+            # Revenue and activity per map ward (location_map → wards via the precomputed table)
+            activity = ward_activity(filtered_df, ward_index)
+            areas_of_interest = areas_by_name(area_store, ward_index, activity.index)
 
             if not areas_of_interest.empty:
-                areas_of_interest["geometry_simplified"] = areas_of_interest.geometry.simplify(tolerance=0.01)
-                centroid = areas_of_interest.geometry_simplified.centroid.unary_union.centroid
+                # Centroids, boxes and simplified outlines are precomputed in the area store
+                center_lon, center_lat, zoom = map_view(areas_of_interest)
+                detail = pick_level(len(areas_of_interest), zoom)
+
+                # Choropleth: colour each ward by the selected measure
+                map_measure = st.radio("Colour wards by", ["Revenue", "Activity (rows)"], horizontal=True)
+                # A region's revenue and rows are split evenly over its wards, so rows can be fractional
+                areas_of_interest = areas_of_interest.join(activity, on="name")
+                measure_column = "revenue" if map_measure == "Revenue" else "rows"
+                areas_of_interest["fill"] = choropleth_colors(areas_of_interest[measure_column])
+                areas_of_interest["revenue_label"] = areas_of_interest["revenue"].map("£{:,.0f}".format)
+                areas_of_interest["rows_label"] = areas_of_interest["rows"].map("{:,.2f}".format)
 
                 # Red flag
-                flag_data = pd.DataFrame({"lon": [centroid.x], "lat": [centroid.y], "icon_name": ["red_flag"]})
+                flag_data = pd.DataFrame({"lon": [center_lon], "lat": [center_lat], "icon_name": ["red_flag"]})
                 icon_mapping = {
                     "red_flag": {
                         "url": "https://upload.wikimedia.org/wikipedia/commons/thumb/3/3e/Red_flag_icon.svg/128px-Red_flag_icon.png",
@@ -1630,11 +1030,12 @@ if {'datetouse_dt','done', 'team_name', 'total'}.issubset(filtered_df.columns):
                 }
 
                 polygon_layer = pdk.Layer(
-                    "GeoJsonLayer",
-                    areas_of_interest["geometry_simplified"].__geo_interface__,
+                    "PolygonLayer",
+                    polygon_payload(areas_of_interest, detail, columns=("fill", "revenue_label", "rows_label")),
+                    get_polygon="polygon",
                     stroked=True,
                     filled=True,
-                    get_fill_color=[160, 120, 80, 200],
+                    get_fill_color="fill",
                     get_line_color=[0, 0, 0],
                     pickable=True
                 )
@@ -1650,13 +1051,14 @@ if {'datetouse_dt','done', 'team_name', 'total'}.issubset(filtered_df.columns):
                     icon_mapping=icon_mapping
                 )
 
-                view_state = pdk.ViewState(latitude=centroid.y, longitude=centroid.x, zoom=8, pitch=0)
+                view_state = pdk.ViewState(latitude=center_lat, longitude=center_lon, zoom=zoom, pitch=0)
 
                 st.pydeck_chart(
                     pdk.Deck(
                         layers=[polygon_layer, flag_layer],
                         initial_view_state=view_state,
-                        map_style="mapbox://styles/mapbox/outdoors-v11"
+                        map_style="mapbox://styles/mapbox/outdoors-v11",
+                        tooltip={"text": "{name}\nRevenue: {revenue_label}\nRows: {rows_label}"}
                     )
                 )
             else:
@@ -1668,51 +1070,21 @@ if {'datetouse_dt','done', 'team_name', 'total'}.issubset(filtered_df.columns):
     st.header("🪵 Materials")
     convert_to_miles = st.checkbox("Convert Equipment/Conductor Length to Miles")
 
-    categories = [
-        ("Poles _erected 🪵", pole_erected_keys, "Quantity"),
-        ("Poles _replaced 🪵", poles_replaced_keys, "Quantity"),
-        ("Transformers ⚡🏭", transformer_keys, "Quantity"),
-        ("Conductors", conductor_keys, "Length (Km)"),
-        ("Conductors_2", conductor_2_keys, "Length (Km)"),
-        ("Equipment", equipment_keys, "Quantity"),
-    ]
-
-    def sanitize_sheet_name(name: str) -> str:
-        name = str(name)
-        name = re.sub(r'[:\\/*?\[\]\n\r]', '_', name)
-        name = re.sub(r'[^\x00-\x7F]', '_', name)  # remove Unicode like m²
-        return name[:31]
 
-
-    for cat_name, keys, y_label in categories:
+    for cat_name, _, y_label in categories:
 
         # Only process if columns exist
         if 'item' not in filtered_df.columns or 'mapped' not in filtered_df.columns:
             st.warning("Missing required columns: item / mapped")
             continue
             
-        # Build regex pattern for this category’s keys
-        pattern = '|'.join([re.escape(k) for k in keys.keys()])
-
-        mask = filtered_df['item'].astype(str).str.contains(pattern, case=False, na=False)
-        sub_df = filtered_df[mask]
+        # Rows whose item matches this category’s keys, aggregated per mapping
+        sub_df, bar_data = materials_category(filtered_df, cat_name)
 
         if sub_df.empty:
             st.info(f"No data found for {cat_name}")
             continue
 
-        # Aggregate
-        if 'qsub' in sub_df.columns:
-            sub_df['qsub_clean'] = pd.to_numeric(
-                sub_df['qsub'].astype(str).str.replace(" ", "").str.replace(",", ".", regex=False),
-                errors='coerce'
-            )
-            bar_data = sub_df.groupby('mapped')['qsub_clean'].sum().reset_index()
-            bar_data.columns = ['Mapped', 'Total']
-        else:
-            bar_data = sub_df['mapped'].value_counts().reset_index()
-            bar_data.columns = ['Mapped', 'Total']
-
         # Divide Conductors_2 by 1000
         if cat_name == "Conductors_2":
             bar_data['Total'] = bar_data['Total']
@@ -1805,7 +1177,9 @@ if {'datetouse_dt','done', 'team_name', 'total'}.issubset(filtered_df.columns):
             # Your original approach but working:
             extra_cols = ['poling team','team_name','shire','project','projectmanager','segmentcode','segmentdesc', 'material_code' ,'pid_ohl_nr', 'sourcefile' ]
             
-            # Rename first
+            # Rename first; team_name replaces the master's own "team lider" so names stay unique
+            if 'team_name' in selected_rows.columns:
+                selected_rows = selected_rows.drop(columns=['team lider'], errors='ignore')
             selected_rows = selected_rows.rename(columns={
                 "poling team": "code", 
                 "team_name": "team lider"
@@ -1835,7 +1209,11 @@ if {'datetouse_dt','done', 'team_name', 'total'}.issubset(filtered_df.columns):
         
 
             if not selected_rows.empty:
-                st.dataframe(selected_rows[display_cols], use_container_width=True)
+                paged_dataframe(
+                    selected_rows[display_cols],
+                    key=f"drill_{cat_name}",
+                    view_key=export_key(filter_state, "drill", cat_name, selected_mapping),
+                )
                 st.write(f"**Total records:** {len(selected_rows)}")
     
                 if 'qsub_clean' in selected_rows.columns:
@@ -1845,129 +1223,21 @@ if {'datetouse_dt','done', 'team_name', 'total'}.issubset(filtered_df.columns):
                 st.info("No records found for this selection")
                 
             # Excel Export - Aggregated
-            buffer_agg = BytesIO()
-            with pd.ExcelWriter(buffer_agg, engine='openpyxl') as writer:
-                aggregated_df = pd.DataFrame()
-                for bar_value in bar_data['Mapped']:
-                    df_bar = sub_df[sub_df['mapped'] == bar_value].copy()
-                    df_bar = df_bar.loc[:, ~df_bar.columns.duplicated()]
-                    if 'datetouse' in df_bar.columns:
-                        df_bar['datetouse_display'] = pd.to_datetime(df_bar['datetouse'], errors='coerce')
-                        df_bar['datetouse_display'] = df_bar['datetouse'].dt.strftime("%d/%m/%Y")
-                        df_bar.loc[df_bar['datetouse'].isna(), 'datetouse_display'] = "Unplanned"
-
-                    # 🔥 Rename columns BEFORE selecting
-                    df_bar = df_bar.rename(columns=column_rename_map)
-
-                    cols_to_include = ['Output','Quantity','material_code','pole','Date','District','project','Project Manager','Circuit','Segment','team lider','PID', 'sourcefile']
-                    cols_to_include = [c for c in cols_to_include if c in df_bar.columns]
-                    df_bar = df_bar[cols_to_include]
-
-                    aggregated_df = pd.concat([aggregated_df, df_bar], ignore_index=True)
-
-                aggregated_df.to_excel(writer, sheet_name='Aggregated', index=False)
-                # Access the worksheet
-                ws = writer.book['Aggregated']
-                ws.insert_rows(1)
-                # ---- Header style ----
-                # ---- Formatting styles ----
-                header_font = Font(bold=True, size=16)
-                header_fill = PatternFill(start_color="00CCFF", end_color="00CCFF", fill_type="solid")
-                thin_side = Side(style="thin")
-                medium_side = Side(style="medium")
-                thick_side = Side(style="thick")
-                light_grey_fill = PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid")
-                white_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
-
-                # AFTER ✅
-                for sheet in [ws]:
-                    sheet.row_dimensions[1].height = 90   # logo row
-
-                # ---- Load & resize images ----
-                IMG_HEIGHT = 120
-                IMG_WIDTH_SMALL = 120
-                IMG_WIDTH_LARGE = IMG_WIDTH_SMALL * 3  # 🔹 3× wider
-
-                img1 = XLImage("Images/GaeltecImage.png")
-                img2 = XLImage("Images/SPEN.png")
-
-                img1.width = IMG_WIDTH_SMALL
-                img1.height = IMG_HEIGHT
-
-                img2.width = IMG_WIDTH_LARGE
-                img2.height = IMG_HEIGHT
-
-                # Position images (row 1)
-                img1.anchor = "B1"
-                img2.anchor = "A1"
-
-                ws.add_image(img1)
-                ws.add_image(img2)
-
-
-                # ---- Formatting (unchanged style) ----
-                for sheet in [ws]:
-                    max_col = sheet.max_column
-                    max_row = sheet.max_row
-
-                    # HEADER → ROW 2 ✅
-                    for col_idx, cell in enumerate(sheet[2], start=1):
-                        cell.font = header_font
-                        cell.fill = header_fill
-                        sheet.column_dimensions[get_column_letter(col_idx)].width = 60 if col_idx == 1 else 20
-                        cell.border = Border(
-                            left=thick_side if col_idx == 1 else medium_side,
-                            right=thick_side if col_idx == max_col else medium_side,
-                            top=thick_side,
-                            bottom=thick_side
-                        )
-
-                    # DATA ROWS → START ROW 3 ✅
-                    for row_idx in range(3, max_row + 1):
-                        fill = light_grey_fill if row_idx % 2 == 1 else white_fill
-                        for col_idx in range(1, max_col + 1):
-                            cell = sheet.cell(row=row_idx, column=col_idx)
-                            cell.fill = fill
-                            cell.border = Border(
-                                left=thin_side,
-                                right=thin_side,
-                                top=thin_side,
-                                bottom=thin_side
-                            )
-
-            buffer_agg.seek(0)
-            st.download_button(
-                f"📥 Download Excel (Aggregated): {cat_name} Details",
-                buffer_agg,
-                file_name=f"{cat_name}_Details_Aggregated.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            frame_download(
+                f"(Aggregated): {cat_name} Details",
+                export_key(filter_state, "materials_aggregated", cat_name),
+                partial(materials_aggregated_excel, sub_df, bar_data),
+                partial(materials_aggregated_frame, sub_df, bar_data),
+                file_stem=f"{cat_name}_Details_Aggregated",
             )
 
             # Excel Export - Separate Sheets
-            buffer_sep = BytesIO()
-            with pd.ExcelWriter(buffer_sep, engine='openpyxl') as writer:
-                for bar_value in bar_data['Mapped']:
-                    df_bar = sub_df[sub_df['mapped'] == bar_value].copy()
-                    df_bar = df_bar.loc[:, ~df_bar.columns.duplicated()]
-                    if 'datetouse' in df_bar.columns:
-                        df_bar['datetouse_display'] = pd.to_datetime(
-                            df_bar['datetouse'], errors='coerce'
-                        )
-                        df_bar.loc[df_bar['datetouse'].isna(), 'datetouse_display'] = "Unplanned"
-
-                    cols_to_include = ['mapped', 'datetouse_display','qsub'] + extra_cols
-                    cols_to_include = [c for c in cols_to_include if c in df_bar.columns]
-                    df_bar = df_bar[cols_to_include]
-
-                    sheet_name = sanitize_sheet_name(bar_value)
-                    df_bar.to_excel(writer, sheet_name=sheet_name, index=False)
-
-            buffer_sep.seek(0)
-            st.download_button(
-                f"📥 Download Excel (Separated): {cat_name} Details",
-                buffer_sep,
-                file_name=f"{cat_name}_Details_Separated.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            frame_download(
+                f"(Separated): {cat_name} Details",
+                export_key(filter_state, "materials_separated", cat_name),
+                partial(materials_separated_excel, sub_df, bar_data, extra_cols),
+                partial(materials_separated_frame, sub_df, bar_data, extra_cols),
+                file_stem=f"{cat_name}_Details_Separated",
             )
 
 # -----------------------------
@@ -1979,18 +1249,8 @@ if misc_df is not None:
     # -----------------------------
     # Data preparation
     # -----------------------------
-    filtered_df['item'] = filtered_df['item'].astype(str)
-    misc_df['column_1'] = misc_df['column_1'].astype(str)
-
-    # Map items to work instructions
-    item_to_column_i = misc_df.set_index('column_1')['column_2'].to_dict()
-    poles_df = filtered_df[filtered_df['pole'].notna() & (filtered_df['pole'].astype(str).str.lower() != "nan")].copy()
-    poles_df['Work instructions'] = poles_df['item'].map(item_to_column_i)
-
-    # Keep only rows with valid instructions, comments, and team_name
-    poles_df_clean = poles_df.dropna(subset=['Work instructions', 'comment', 'team_name'])[
-        ['pole', 'segmentcode', 'Work instructions', 'comment', 'team_name']
-    ]
+    # Map items to work instructions; keep rows with instructions, comments and team_name
+    poles_df_clean = build_poles_df(filtered_df, misc_df)
 
     # -----------------------------
     # 🔘 Segment selector
@@ -2016,7 +1276,11 @@ if misc_df is not None:
     # Display pole details if one is selected
     if selected_pole != "All" and not poles_df_view.empty:
         st.write(f"Details for pole **{selected_pole}**:")
-        st.dataframe(poles_df_view)
+        paged_dataframe(
+            poles_df_view,
+            key="works_poles",
+            view_key=export_key(filter_state, "works", file_digest(misc_file), selected_segment, selected_pole),
+        )
 
     # -----------------------------
     # 📊 Pie chart (Works breakdown)
@@ -2051,12 +1315,12 @@ if misc_df is not None:
     # 📄 Word export
     # -----------------------------
     if not poles_df_view.empty:
-        word_file = poles_to_word(poles_df_view)
-        st.download_button(
-            label="⬇️ Download Work Instructions (.docx)",
-            data=word_file,
+        export_download(
+            "⬇️ Download Work Instructions (.docx)",
+            export_key(filter_state, "work_instructions", file_digest(misc_file), selected_segment, selected_pole),
+            partial(poles_to_word, poles_df_view),
             file_name="Pole_Work_Instructions.docx",
-            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+            mime=DOCX_MIME,
         )
 
 general_summary = pd.DataFrame(
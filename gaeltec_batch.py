@@ -0,0 +1,131 @@
+# gaeltec_batch.py
+# Headless report runner: applies a filter spec to a Master.parquet and writes the
+# dashboard's exports to disk, one bundle for the whole selection plus one per
+# project (or project manager). Bundles are rendered in a process pool.
+#
+#   python gaeltec_batch.py --master Master.parquet --misc miscellaneous.parquet \
+#       --out reports --shire Ayrshire --start 2026-01-01 --end 2026-03-31 --by project
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+import pandas as pd
+
+from gaeltec_core import (
+    MASTER_COLUMNS, MISC_COLUMNS, RAW_DATE_COLUMNS,
+    bundle_dirname, bundle_files, master_filter, partition_frames, prepare_dataframe,
+    read_masters, read_parquet_columns,
+)
+
+DATE_BASES = {'planned': 'datetouse_dt', 'done': 'done_dt'}
+
+# CLI option → Master column for the multiselect-style filters
+FILTER_OPTIONS = {
+    'shire': 'shire',
+    'project': 'project',
+    'pm': 'projectmanager',
+    'segment': 'segmentcode',
+    'pole': 'pole',
+    'type': 'type',
+    'team': 'team_name',
+}
+
+
+def load_master(paths, args):
+    """Read only the needed columns / row groups of the master(s) and normalize them."""
+    sources = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            sources.append((os.path.basename(path), f.read()))
+    date_column = DATE_BASES[args.date_source]
+    pushdown = partial(master_filter, shires=args.shire, projects=args.project, start=args.start,
+                       end=args.end, date_column=RAW_DATE_COLUMNS[date_column])
+    df = prepare_dataframe(read_masters(sources, MASTER_COLUMNS, pushdown))
+    if date_column != 'datetouse_dt':
+        df['datetouse_dt'] = df[date_column]
+    return df
+
+
+def filter_master(df, args):
+    """Apply the category filters and the date range / unplanned selection."""
+    mask = pd.Series(True, index=df.index)
+    for option, column in FILTER_OPTIONS.items():
+        values = getattr(args, option)
+        if values and column in df.columns:
+            mask &= df[column].isin(values)
+
+    dates = df['datetouse_dt']
+    if args.unplanned:
+        mask &= dates.isna()
+    if args.start is not None:
+        mask &= dates >= pd.Timestamp(args.start)
+    if args.end is not None:
+        mask &= dates < pd.Timestamp(args.end) + pd.Timedelta(days=1)
+    return df[mask]
+
+
+def write_bundle(name, df, out_dir, misc_df=None):
+    """Write every export for one partition into out_dir/<name>/ and return the paths."""
+    bundle_dir = os.path.join(out_dir, bundle_dirname(name))
+    os.makedirs(bundle_dir, exist_ok=True)
+    written = []
+    for filename, data in bundle_files(df, misc_df):
+        path = os.path.join(bundle_dir, filename)
+        with open(path, 'wb') as f:
+            f.write(data)
+        written.append(path)
+    return written
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Render Gaeltec dashboard exports without Streamlit.")
+    parser.add_argument('--master', required=True, nargs='+',
+                        help="Master.parquet, or one parquet per project")
+    parser.add_argument('--misc', help="miscellaneous.parquet (pole work instructions)")
+    parser.add_argument('--out', default="reports", help="output directory")
+    parser.add_argument('--date-source', choices=list(DATE_BASES), default='planned',
+                        help="planned = datetouse (Planned + Done), done = done date only")
+    for option, column in FILTER_OPTIONS.items():
+        parser.add_argument(f'--{option}', action='append', metavar='VALUE',
+                            help=f"keep rows with this {column} (repeatable)")
+    parser.add_argument('--start', type=pd.Timestamp, help="first date, YYYY-MM-DD")
+    parser.add_argument('--end', type=pd.Timestamp, help="last date (inclusive), YYYY-MM-DD")
+    parser.add_argument('--unplanned', action='store_true', help="only rows without a date")
+    parser.add_argument('--by', choices=['project', 'projectmanager', 'none'], default='project',
+                        help="also write one bundle per project / project manager")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="processes used to render bundles")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.unplanned and (args.start is not None or args.end is not None):
+        raise SystemExit("--unplanned cannot be combined with --start/--end")
+
+    df = filter_master(load_master(args.master, args), args)
+    if df.empty:
+        raise SystemExit("No rows match the selected filters")
+
+    misc_df = None
+    if args.misc:
+        with open(args.misc, 'rb') as f:
+            misc_df = read_parquet_columns(f.read(), MISC_COLUMNS)
+
+    partitions = [("All", df)]
+    if args.by != 'none':
+        partitions += partition_frames(df, args.by)
+
+    os.makedirs(args.out, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(write_bundle, name, part, args.out, misc_df): name
+                   for name, part in partitions}
+        for future in as_completed(futures):
+            paths = future.result()
+            print(f"{futures[future]}: {len(paths)} files")
+
+
+if __name__ == "__main__":
+    main()
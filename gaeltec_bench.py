@@ -0,0 +1,306 @@
+# gaeltec_bench.py
+# Benchmarks for the dashboard's hot paths on a synthetic Master.parquet built from
+# the real column set and the item vocabulary of the mapping dicts. Every case is
+# timed in a clean run, then memory-profiled in a second run (tracemalloc peak for
+# Python objects, Arrow pool peak, process peak RSS); the results go to a JSON
+# report that can be diffed between commits.
+#
+#   python gaeltec_bench.py --rows 10000 100000 1000000 --out bench.json
+#   python gaeltec_bench.py --rows 5000000 --cases ingest filter --write-master Master_5M.parquet
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from gaeltec_core import (
+    CATEGORY_COLUMNS, MASTER_COLUMNS, MATERIALS_EXTRA_COLUMNS,
+    categories, file_project_mapping, mapping_region, project_mapping,
+    build_filter_index, build_output_workbook, build_poles_df, build_rollup_cube,
+    generate_excel_styled_multilevel, index_mask, index_options, materials_aggregated_excel,
+    materials_category, materials_separated_excel, poles_to_word, prepare_dataframe, read_masters,
+    revenue_tables, to_excel,
+)
+from gaeltec_maps import MAPS_DIR, build_geometry_store, load_geometry_store
+
+# Items outside every mapping dict, so category masks also see misses
+OTHER_ITEMS = [
+    "Erect 11kV/33kV ABSW.",
+    "Remove 11kV/33kV ABSW",
+    "Remove pole mounted transformer",
+    "Install service span including connection to mainline & building / structure",
+    "Erect 3.ph fuse units at single tee off pole or in line pole.",
+    "Erect 1.ph fuse units at single tee off pole or in line pole.",
+]
+
+
+def synthetic_master(n_rows, seed=0) -> pd.DataFrame:
+    """
+    A raw (pre-prepare_dataframe) master with every MASTER_COLUMNS column.
+    Items and mapped labels come from the category dicts; quantities use the
+    "1 234,5" text format; about 10% of rows are unplanned.
+    """
+    rng = np.random.default_rng(seed)
+
+    vocab = [(item, label) for _, keys, _ in categories for item, label in keys.items()]
+    vocab += [(item, item) for item in OTHER_ITEMS]
+    pick = rng.integers(0, len(vocab), n_rows)
+    items = np.array([item for item, _ in vocab], dtype=object)[pick]
+    mapped = np.array([label for _, label in vocab], dtype=object)[pick]
+
+    projects = np.array(list(file_project_mapping), dtype=object)
+    pms = np.array(list(project_mapping), dtype=object)
+    locations = np.array(list(mapping_region), dtype=object)
+    teams = np.array([f"Team {i}" for i in range(1, 25)], dtype=object)
+    n_segments = max(10, n_rows // 500)
+    n_poles = max(50, n_rows // 20)
+
+    def choice(values):
+        return values[rng.integers(0, len(values), n_rows)]
+
+    def text_numbers(values):
+        return pd.Series(values).map(lambda v: f"{v:,.2f}".replace(",", " ").replace(".", ",")).to_numpy()
+
+    qty = rng.integers(1, 50, n_rows).astype(float)
+    total = rng.gamma(2.0, 250.0, n_rows).round(2)
+    orig = (total * rng.uniform(0.8, 1.2, n_rows)).round(2)
+
+    start = np.datetime64('2024-01-01')
+    offsets = rng.integers(0, 3 * 365, n_rows)
+    dates = pd.Series(start + offsets.astype('timedelta64[D]')).dt.strftime('%Y-%m-%d')
+    dates = dates.mask(rng.random(n_rows) < 0.1)
+    done = dates.where(rng.random(n_rows) < 0.6)
+
+    segments = np.array([f"SEG{i:05d}" for i in range(n_segments)], dtype=object)
+    segment_pick = rng.integers(0, n_segments, n_rows)
+    poles = pd.Series(np.array([f"P{i:06d}" for i in range(n_poles)], dtype=object)[rng.integers(0, n_poles, n_rows)])
+    poles = poles.mask(rng.random(n_rows) < 0.2)
+
+    team = choice(teams)
+    df = pd.DataFrame({
+        'item': items,
+        'mapped': mapped,
+        'qty': text_numbers(qty),
+        'qsub': text_numbers(qty * rng.uniform(0.5, 1.0, n_rows)),
+        'total': text_numbers(total),
+        'orig': text_numbers(orig),
+        'pole': poles,
+        'type': choice(np.array(['HV', 'LV', 'EHV'], dtype=object)),
+        'comment': choice(np.array(['', 'Access via farm track', 'Replace stay', 'Check earthing'], dtype=object)),
+        'material_code': choice(np.array([f"MC{i:04d}" for i in range(400)], dtype=object)),
+        'segmentcode': segments[segment_pick],
+        'segmentdesc': ('Circuit ' + pd.Series(segments[segment_pick])).to_numpy(),
+        'shire': choice(np.array(['Ayrshire', 'Lanark'], dtype=object)),
+        'region': choice(locations),
+        'location_map': choice(locations),
+        'project': choice(projects),
+        'projectmanager': choice(pms),
+        'team_name': team,
+        'team lider': team,
+        'poling team': choice(np.array([f"PT{i}" for i in range(12)], dtype=object)),
+        'pid_ohl_nr': choice(np.array([f"PID{i:05d}" for i in range(2000)], dtype=object)),
+        'sourcefile': choice(np.array([f"sheet_{i}.xlsx" for i in range(50)], dtype=object)),
+        'datetouse': dates.to_numpy(),
+        'done': done.to_numpy(),
+    })
+    return df[MASTER_COLUMNS]
+
+
+def synthetic_misc(master) -> pd.DataFrame:
+    # miscellaneous.parquet: item → work instruction for every item in the master
+    items = pd.unique(master['item'])
+    return pd.DataFrame({'column_1': items, 'column_2': [f"Work: {item}" for item in items]})
+
+
+def parquet_bytes(df) -> bytes:
+    buffer = BytesIO()
+    df.to_parquet(buffer, index=False, row_group_size=100_000)
+    return buffer.getvalue()
+
+
+def peak_rss_mib():
+    # Process high-water RSS so far (ru_maxrss is KiB on Linux)
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+def measure(fn):
+    """
+    Run `fn` twice: once untraced for the timing, once under tracemalloc for memory.
+    tracemalloc slows allocation-heavy code and can't see Arrow's memory pool, so the
+    second run goes through a proxy pool for the Arrow peak, and the process peak RSS
+    is recorded as well. Returns (result, metrics).
+    """
+    t0 = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - t0
+
+    default_pool = pa.default_memory_pool()
+    arrow_pool = pa.proxy_memory_pool(default_pool)
+    pa.set_memory_pool(arrow_pool)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        pa.set_memory_pool(default_pool)
+    rss = peak_rss_mib()
+    return result, {
+        'seconds': round(seconds, 4),
+        'peak_mib': round(peak / 2**20, 1),
+        'arrow_peak_mib': round(arrow_pool.max_memory() / 2**20, 1),
+        'max_rss_mib': None if rss is None else round(rss, 1),
+    }
+
+
+# --- Cases: each takes the shared context and returns an output size (rows or bytes) ---
+
+def case_ingest(ctx):
+    df = prepare_dataframe(read_masters([("Master.parquet", ctx['parquet'])], MASTER_COLUMNS))
+    return len(df)
+
+def case_filter(ctx):
+    # Index build plus the cascading sidebar: pick the first value of each filter in turn
+    df = ctx['df']
+    index = build_filter_index(df, CATEGORY_COLUMNS)
+    mask = np.ones(len(df), dtype=bool)
+    for column in CATEGORY_COLUMNS:
+        entry = index.get(column)
+        if entry is None:
+            continue
+        options = index_options(entry, mask)
+        if options and column in ('shire', 'project'):
+            mask = mask & index_mask(entry, options[:1], len(mask))
+    return int(mask.sum())
+
+def case_to_excel(ctx):
+    revenue_per_project, revenue_per_team = revenue_tables(build_rollup_cube(ctx['df']))
+    return len(to_excel(revenue_per_project, revenue_per_team).getvalue())
+
+def case_planning_excel(ctx):
+    df = ctx['df']
+    return len(generate_excel_styled_multilevel(df, df[df['pole'].notna()]).getvalue())
+
+def case_output_workbook(ctx):
+    return len(build_output_workbook(ctx['df']).getvalue())
+
+def case_materials(ctx):
+    size = 0
+    for cat_name, _, _ in categories:
+        sub_df, bar_data = materials_category(ctx['df'], cat_name)
+        if sub_df.empty:
+            continue
+        size += len(materials_aggregated_excel(sub_df, bar_data).getvalue())
+        size += len(materials_separated_excel(sub_df, bar_data, MATERIALS_EXTRA_COLUMNS).getvalue())
+    return size
+
+def case_maps_build(ctx):
+    # One-time preprocessing: parse the distinct Maps/ files and write the store
+    return len(build_geometry_store(MAPS_DIR, ctx['cache_dir']))
+
+def case_maps(ctx):
+    # What the Regional Map View pays once per process (store already built)
+    return len(load_geometry_store(MAPS_DIR, ctx['cache_dir']))
+
+def case_word(ctx):
+    poles_df = build_poles_df(ctx['df'], ctx['misc'])
+    return len(poles_to_word(poles_df).getvalue())
+
+
+CASES = {
+    'ingest': case_ingest,
+    'filter': case_filter,
+    'to_excel': case_to_excel,
+    'planning_excel': case_planning_excel,
+    'output_workbook': case_output_workbook,
+    'materials': case_materials,
+    'maps_build': case_maps_build,
+    'maps': case_maps,
+    'word': case_word,
+}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(sizes, cases, seed=0, repeat=1, write_master=None):
+    results = []
+    cache_dir = tempfile.mkdtemp(prefix="gaeltec_bench_")
+    for n_rows in sizes:
+        raw = synthetic_master(n_rows, seed)
+        data = parquet_bytes(raw)
+        if write_master:
+            with open(write_master, 'wb') as f:
+                f.write(data)
+        ctx = {
+            'parquet': data,
+            'df': prepare_dataframe(read_masters([("Master.parquet", data)], MASTER_COLUMNS)),
+            'misc': synthetic_misc(raw),
+            'cache_dir': cache_dir,
+        }
+        del raw
+
+        for name in cases:
+            for attempt in range(repeat):
+                try:
+                    output, metrics = measure(lambda: CASES[name](ctx))
+                    record = {'case': name, 'rows': n_rows, 'run': attempt, **metrics, 'output': output}
+                except Exception as e:
+                    record = {'case': name, 'rows': n_rows, 'run': attempt, 'error': f"{type(e).__name__}: {e}"}
+                results.append(record)
+                print(json.dumps(record))
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Gaeltec dashboard hot paths on synthetic data.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000],
+                        help="master sizes to generate (e.g. 10000 ... 5000000)")
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--repeat', type=int, default=1, help="runs per case and size")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default="bench.json", help="JSON report path")
+    parser.add_argument('--write-master', metavar='PATH',
+                        help="also save the (last) synthetic Master.parquet here")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = {
+        'revision': git_revision(),
+        'timestamp': pd.Timestamp.now(tz='UTC').isoformat(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'seed': args.seed,
+        'results': run(args.rows, args.cases, args.seed, args.repeat, args.write_master),
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
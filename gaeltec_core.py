@@ -0,0 +1,1429 @@
+# gaeltec_core.py
+# Data loading, mappings and export builders shared by the Streamlit dashboard
+# (Gaeltec2026.py) and the headless batch runner (gaeltec_batch.py).
+# Nothing in here may call Streamlit.
+import multiprocessing
+import os
+import re
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import date, datetime
+from functools import lru_cache
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from docx import Document
+from docx.enum.text import WD_COLOR_INDEX
+from docx.shared import Pt
+import xlsxwriter
+from PIL import Image
+
+# Logos live next to this module so exports work from any working directory
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Images")
+GAELTEC_LOGO = os.path.join(IMAGES_DIR, "GaeltecImage.png")
+SPEN_LOGO = os.path.join(IMAGES_DIR, "SPEN.png")
+
+# --- MAPPINGS ---
+
+# --- Project Manager Mapping ---
+project_mapping = {
+    "Jonathon Mcclung": ["Ayrshire", "PCB"],
+    "Gary MacDonald": ["Ayrshire", "LV"],
+    "Jim Gaffney": ["Lanark", "PCB"],
+    "Calum Thomson": ["Ayrshire", "Connections"],
+    "Calum Thomsom": ["Ayrshire", "Connections"],
+    "Calum Thompson": ["Ayrshire", "Connections"],
+    "Andrew Galt": ["Ayrshire", "-"],
+    "Henry Gordon": ["Ayrshire", "-"],
+    "Jonathan Douglas": ["Ayrshire", "11 kV"],
+    "Jonathon Douglas": ["Ayrshire", "11 kV"],
+    "Matt": ["Lanark", ""],
+    "Lee Fraser": ["Ayrshire", "Connections"],
+    "Lee Frazer": ["Ayrshire", "Connections"],
+    "Mark": ["Lanark", "Connections"],
+    "Mark Nicholls": ["Ayrshire", "Connections"],
+    "Cameron Fleming": ["Lanark", "Connections"],
+    "Ronnie Goodwin": ["Lanark", "Connections"],
+    "Ian Young": ["Ayrshire", "Connections"],
+    "Matthew Watson": ["Lanark", "Connections"],
+    "Aileen Brese": ["Ayrshire", "Connections"],
+    "Mark McGoldrick": ["Lanark", "Connections"]
+}
+
+# --- Region Mapping ---
+mapping_region = {
+    "Newmilns": ["Irvine Valley"],
+    "New Cumnock": ["New Cumnock"],
+    "Kilwinning": ["Kilwinning"],
+    "Stewarton": ["Irvine Valley"],
+    "Kilbirnie": ["Kilbirnie and Beith"],
+    "Coylton": ["Ayr East"],
+    "Irvine": ["Irvine Valley", "Irvine East", "Irvine West"],
+    "TROON": ["Troon"],
+    "Ayr": ["Ayr East", "Ayr North", "Ayr West"],
+    "Maybole": ["Maybole, North Carrick and Coylton"],
+    "Clerkland": ["Irvine Valley"],
+    "Glengarnock": ["Kilbirnie and Beith"],
+    "Ayrshire": ["North Coast and Cumbraes","Prestwick", "Saltcoats and Stevenston", "Troon", "Ayr East", "Ayr North",
+                 "Ayr West","Annick","Ardrossan and Arran","Dalry and West Kilbride","Girvan and South Carrick","Irvine East",
+                 "Irvine Valley","Irvine West","Kilbirnie and Beith","Kilmarnock East and Hurlford","Kilmarnock North",
+                 "Kilmarnock South","Kilmarnock West and Crosshouse","Kilwinning","Kyle","Maybole, North Carrick and Coylton",
+                 "Ayr, Carrick and Cumnock","East_Ayrshire","North_Ayrshre","South_Ayrshre","Doon Valley"],
+    "Lanark": ["Abronhill, Kildrum and the Village","Airdrie Central","Airdrie North","Airdrie South","Avondale and Stonehouse",
+               "Ballochmyle","Bellshill","Blantyre","Bothwell and Uddingston","Cambuslang East","Cambuslang West",
+               "Clydesdale East","Clydesdale North","Clydesdale South","Clydesdale West","Coatbridge North and Glenboig",
+               "Coatbridge South","Coatbridge West","Cumbernauld North","Cumbernauld South",
+               "East Kilbride Central North","East Kilbride Central South","East Kilbride East","East Kilbride South",
+               "East Kilbride West","Fortissat","Hamilton North and East","Hamilton South","Hamilton West and Earnock",
+               "Mossend and Holytown","Motherwell North","Motherwell South East and Ravenscraig","Motherwell West",
+               "Rutherglen Central and North","Rutherglen South","Strathkelvin","Thorniewood","Wishaw","Larkhall",
+               "Airdrie and Shotts","Cumbernauld, Kilsyth and Kirkintilloch East","East Kilbride, Strathaven and Lesmahagow",
+               "Lanark and Hamilton East","Motherwell and Wishaw","North_Lanarkshire","South_Lanarkshire"]
+}
+
+# --- File Project Mapping ---
+file_project_mapping = {
+    "pcb 2022": ["Ayrshire", "PCB"],
+    "33kv refurb": ["Ayrshire", "33kv Refurb"],
+    "connections": ["Ayrshire", "Connections"],
+    "storms": ["Ayrshire", "Storms"],
+    "11kv refurb": ["Ayrshire", "11kv Refurb"],
+    "11kV Refurb Ayrshire 2026": ["Ayrshire", "11kV Refurb"],
+    "11kV Refurb Ayrshire Pinwherry": ["Ayrshire", "11kV Refurb"],
+    "aurs road": ["Ayrshire", "Aurs Road"],
+    "spen labour": ["Ayrshire", "SPEN Labour"],
+    "lvhi5": ["Ayrshire", "LV"],
+    "pcb": ["Ayrshire", "PCB"],
+    "lanark": ["Lanark", ""],
+    "11kv refur": ["Lanark", "11kv Refurb"],
+    "lv & esqcr": ["Lanark", "LV"],
+    "11kv rebuilt": ["Lanark", "11kV Rebuilt"],
+    "33kv rebuilt": ["Lanark", "33kV Rebuilt"],
+    "Hi5_4_Lanark_2026": ["Lanark", "11kV Refurb"]
+}
+
+pole_erected_keys = {
+    "Erect Single HV/EHV Pole, up to and including 12 metre pole":"Erect HV pole", 
+    "Erect Single HV/EHV Pole, up to and including 12 metre pole.":"Erect HV pole",
+    "Erect LV Structure Single Pole, up to and including 12 metre pole" :"Erect LV pole",
+    "Erect Section Structure 'H' HV/EHV Pole, up to and including 12 metre pole.":"H HV pole"
+}
+
+poles_replaced_keys = {
+    "Recover single pole, up to and including 15 metres in height, and reinstate, all ground conditions":"Recover single pole",
+    "Recover 'A' / 'H' pole, up to and including 15 metres in height, and reinstate, all ground conditions":"Recover H pole"
+}
+
+
+# --- Transformer Mappings ---
+transformer_keys = {
+    "Transformer 1ph 50kVA": "TX 1ph (50kVA)",
+    "Transformer 3ph 50kVA": "TX 3ph (50kVA)",
+    "Transformer 1ph 100kVA": "TX 1ph (100kVA)",
+    "Transformer 1ph 25kVA": "TX 1ph (25kVA)",
+    "Transformer 3ph 200kVA": "TX 3ph (200kVA)",
+    "Transformer 3ph 100kVA": "TX 3ph (100kVA)"
+}
+
+# --- Equipment / Conductor Mappings ---
+conductor_keys = {
+    "Hazel - 50mm² AAAC bare (1000m drums)": "Hazel 50mm²",
+    "Oak - 100mm² AAAC bare (1000m drums)": "Oak 100mm²",
+    "Ash - 150mm² AAAC bare (1000m drums)": "Ash 150mm²",
+    "Poplar - 200mm² AAAC bare (1000m drums)": "Poplar 200mm²",
+    "Upas - 300mm² AAAC bare (1000m drums)": "Upas 300mm²",
+    "Poplar OPPC - 200mm² AAAC equivalent bare": "Poplar OPPC 200mm²",
+    "Upas OPPC - 300mm² AAAC equivalent bare": "Upas OPPC 300mm²",
+    # ACSR
+    "Gopher - 25mm² ACSR bare (1000m drums)": "Gopher 25mm²",
+    "Caton - 25mm² Compacted ACSR bare (1000m drums)": "Caton 25mm²",
+    "Rabbit - 50mm² ACSR bare (1000m drums)": "Rabbit 50mm²",
+    "Wolf - 150mm² ACSR bare (1000m drums)": "Wolf 150mm²",
+    "Horse - 70mm² ACSR bare": "Horse 70mm²",
+    "Dog - 100mm² ACSR bare (1000m drums)": "Dog 100mm²",
+    "Dingo - 150mm² ACSR bare (1000m drums)": "Dingo 150mm²",
+}
+
+    # LV cables per meter
+conductor_2_keys = {
+    "ABC 2 core x 35mm² + 25mm² bare earth (250m drums)": "ABC 2 core x 35mm² + 25mm² bare earth (250m drums)",
+    "ABC 4 core x 35mm² + 25mm² bare earth (250m drums)": "ABC 4 core x 35mm² + 25mm² bare earth (250m drums)",
+    "ABC 2 core x 35mm² (250m drums)": "ABC 2 core x 50mm² (250m drums)",
+    "ABC 2 core x 50mm² (250m drums)": "ABC 2 core x 50mm² (250m drums)",
+    "ABC 2 core x 95mm² + 50mm² bare earth  (300m drums)": "ABC 2 core x 95mm² + 50mm² bare earth  (300m drums)",
+    "ABC 4 core x 35mm² (250m drums)": "ABC 4 core x 35mm² (250m drums)",
+    "ABC 4 core x 50mm² (250m drums)": "ABC 4 core x 50mm² (250m drums)",
+    "ABC 4 core x 95mm² (250m drums)": "ABC 4 core x 95mm² (250m drums)",
+    "ABC 2 core x 50mm² + 50mm² bare earth  (300m drums)": "ABC 2 core x 50mm² + 50mm² bare earth  (300m drums)",
+    "ABC 4 core x 50mm² + 50mm² bare earth  (300m drums)": "ABC 4 core x 50mm² + 50mm² bare earth  (300m drums)",
+    "ABC 4 core x 95mm² + 50mm² bare earth (300m drums)": "ABC 4 core x 95mm² + 50mm² bare earth (300m drums)",
+    "ABC 2 core x 95mm² + 50mm² bare earth  (300m drums)": "ABC 2 core x 95mm² + 50mm² bare earth  (300m drums)",
+}
+
+
+equipment_keys = {
+    "Noja": "Noja",
+    "0.5 kVa Tx for Noja": "0.5 kVa Tx for Noja",
+    "11kV PMSW (Soule)": "11kV PMSW (Soule)",
+    "11kv ABSW Hookstick Standard": "11kv ABSW Hookstick Standard",
+    "11kv ABSW Hookstick Spring loaded mech": "11kv ABSW Hookstick Spring loaded mech",
+    "33kv ABSW Hookstick Dependant": "33kv ABSW Hookstick Dependant",
+    "11KV FUSE UNIT - C-TYPE": "11KV FUSE UNIT - C-TYPE",
+    "11KV SOLID LINK - C-TYPE": "11KV SOLID LINK - C-TYPE",
+    "11KV OHL ASL C-TYPE RESET 20A 2 SHOT": "11KV OHL ASL C-TYPE RESET 20A 2 SHOT",
+    "11KV OHL ASL C-TYPE RESET 25A 2 SHOT": "11KV OHL ASL C-TYPE RESET 25A 2 SHOT",
+    "11KV OHL ASL C-TYPE RESET 40A 1 SHOT": "11KV OHL ASL C-TYPE RESET 40A 1 SHOT",
+    "11KV OHL ASL C-TYPE RESET 40A 2 SHOT": "11KV OHL ASL C-TYPE RESET 40A 2 SHOT",
+    "11KV OHL ASL C-TYPE RESET 63A 1 SHOT": "11KV OHL ASL C-TYPE RESET 63A 1 SHOT",
+    "11KV OHL ASL C-TYPE RESET 63A 2 SHOT": "11KV OHL ASL C-TYPE RESET 63A 2 SHOT",
+    "11KV OHL ASL C-TYPE RESET 63A 3 SHOT": "11KV OHL ASL C-TYPE RESET 63A 3 SHOT",
+    "11KV OHL ASL C-TYPE RESET 100A 1 SHOT": "11KV OHL ASL C-TYPE RESET 100A 1 SHOT",
+    "11KV OHL ASL C-TYPE RESET 100A 2 SHOT": "11KV OHL ASL C-TYPE RESET 100A 2 SHOT",
+    "11KV OHL ASL C-TYPE RESET 100A 3 SHOT": "11KV OHL ASL C-TYPE RESET 100A 3 SHOT",
+    "11KV FUSE CARRIER - C-TYPE": "11KV FUSE CARRIER - C-TYPE",
+    "11KV OHL FUSE ELEMENT C-TYPE 15A": "11KV OHL FUSE ELEMENT C-TYPE 15A",
+    "11KV OHL FUSE ELEMENT C-TYPE 25A": "11KV OHL FUSE ELEMENT C-TYPE 25A",
+    "11KV OHL FUSE ELEMENT C-TYPE 30A": "11KV OHL FUSE ELEMENT C-TYPE 30A",
+    "11KV OHL FUSE ELEMENT C-TYPE 40A": "11KV OHL FUSE ELEMENT C-TYPE 40A",
+    "11KV OHL FUSE ELEMENT C-TYPE 50A": "11KV OHL FUSE ELEMENT C-TYPE 50A",
+    "11KV OHL ASL - CHEMICAL ACTUATOR": "11KV OHL ASL - CHEMICAL ACTUATOR",
+    "11KV OHL ASL DJP-TYPE 20A 2 SHOT": "11KV OHL ASL DJP-TYPE 20A 2 SHOT",
+    "11KV OHL ASL DJP-TYPE 25A 1 SHOT": "11KV OHL ASL DJP-TYPE 25A 1 SHOT",
+    "11KV OHL ASL DJP-TYPE 25A 2 SHOT": "11KV OHL ASL DJP-TYPE 25A 2 SHOT",
+    "11KV OHL ASL DJP-TYPE 40A 1 SHOT": "11KV OHL ASL DJP-TYPE 40A 1 SHOT",
+    "11KV OHL ASL DJP-TYPE 40A 2 SHOT": "11KV OHL ASL DJP-TYPE 40A 2 SHOT",
+    "11KV OHL ASL DJP-TYPE 63A 1 SHOT": "11KV OHL ASL DJP-TYPE 63A 1 SHOT",
+    "11KV OHL ASL DJP-TYPE 63A 2 SHOT": "11KV OHL ASL DJP-TYPE 63A 2 SHOT",
+    "11KV OHL ASL DJP-TYPE 63A 3 SHOT": "11KV OHL ASL DJP-TYPE 63A 3 SHOT",
+    "11KV OHL ASL DJP-TYPE 100A 1 SHOT": "11KV OHL ASL DJP-TYPE 100A 1 SHOT",
+    "11KV OHL ASL DJP-TYPE 100A 2 SHOT": "11KV OHL ASL DJP-TYPE 100A 2 SHOT",
+    "11KV OHL ASL DJP-TYPE 100A 3 SHOT": "11KV OHL ASL DJP-TYPE 100A 3 SHOT",
+    "11KV OHL FUSE ELEMENT DJP-TYPE 15A": "11KV OHL FUSE ELEMENT DJP-TYPE 15A",
+    "11KV OHL FUSE ELEMENT DJP-TYPE 25A": "11KV OHL FUSE ELEMENT DJP-TYPE 25A",
+    "11KV OHL FUSE ELEMENT DJP-TYPE 30A": "11KV OHL FUSE ELEMENT DJP-TYPE 30A",
+    "11KV OHL FUSE ELEMENT DJP-TYPE 40A": "11KV OHL FUSE ELEMENT DJP-TYPE 40A",
+    "11KV OHL FUSE ELEMENT DJP-TYPE 50A": "11KV OHL FUSE ELEMENT DJP-TYPE 50A",
+}
+
+
+summary_items = [
+    "Erect Single HV/EHV Pole, up to and including 12 metre pole.",
+    "Erect Section Structure 'H' HV/EHV Pole, up to and including 12 metre pole",
+    "Erect LV Structure Single Pole, up to and including 12 metre pole",
+    "Recover single pole, up to and including 15 metres in height, and reinstate, all ground conditions",
+    "Recover 'A' / 'H' pole, up to and including 15 metres in height, and reinstate, all ground conditions",
+    "Erect 11kV/33kV ABSW.",
+    "Remove 11kV/33kV ABSW",
+    "Noja"
+    "0.5 kVa Tx for Noja"
+    "11kV PMSW (Soule)"
+    "Remove Auto Reclosure",
+    "Erect pole mounted transformer up to 100kVA 1.ph",
+    "Erect pole mounted transformer up to 200kVA 3.p.h",
+    "Remove pole mounted transformer",
+    "Remove platform mounted or 'H' pole mounted transformer",
+    "Install bare conductor, run out, sag, terminate, bind in and connect jumpers; <100mm²",
+    "Install bare conductor, run out, sag, terminate, bind in and connect jumpers; >=100mm² <200mm²",
+    "Install conductor, run out, sag, terminate, clamp in and connect jumpers; 2c + Earth",
+    "Install conductor, run out, sag, terminate, clamp in and connect jumpers; 4c + Earth",
+    "Install service span including connection to mainline & building / structure",
+    "Erect 3.ph fuse units at single tee off pole or in line pole"
+    "Remove 1.ph or 3.ph HV fuses",    
+]
+
+categories = [
+    ("Poles _erected 🪵", pole_erected_keys, "Quantity"),
+    ("Poles _replaced 🪵", poles_replaced_keys, "Quantity"),
+    ("Transformers ⚡🏭", transformer_keys, "Quantity"),
+    ("Conductors", conductor_keys, "Length (Km)"),
+    ("Conductors_2", conductor_2_keys, "Length (Km)"),
+    ("Equipment", equipment_keys, "Quantity"),
+]
+
+column_rename_map = {
+    "mapped": "Output",
+    "segmentcode": "Circuit",
+    "datetouse_display": "Date",
+    "qty": "Quantity_original",
+    "qsub": "Quantity_used",
+    "segmentdesc": "Segment",
+    "shire": "District",
+    "pid_ohl_nr": "PID",
+    "projectmanager": "Project Manager"
+}
+
+# Columns the dashboard actually reads from each upload (after strip/lower)
+MASTER_COLUMNS = [
+    'item', 'mapped', 'qty', 'qsub', 'total', 'orig', 'pole', 'type', 'comment', 'material_code',
+    'segmentcode', 'segmentdesc', 'shire', 'region', 'location_map', 'project', 'projectmanager',
+    'team_name', 'team lider', 'poling team', 'pid_ohl_nr', 'sourcefile', 'datetouse', 'done'
+]
+
+MISC_COLUMNS = ['column_1', 'column_2']
+
+# Filter dimensions stored as categoricals by prepare_dataframe
+CATEGORY_COLUMNS = ['shire', 'project', 'projectmanager', 'segmentcode', 'pole', 'type', 'team_name']
+
+# Date-source radio options → normalized date column they filter on
+RAW_DATE_COLUMNS = {'datetouse_dt': 'datetouse', 'done_dt': 'done'}
+
+DATE_SOURCES = {
+    "Planned + Done (datetouse)": 'datetouse_dt',
+    "Done Only (done)": 'done_dt',
+}
+
+# Dimensions (besides date) of the daily revenue rollup
+CUBE_DIMENSIONS = ['shire', 'project', 'projectmanager', 'segmentcode', 'team_name']
+
+export_columns = [
+    'Output','comment', 'item', 'Quantity_original','Quantity_used', 'material_code','type', 'pole', 'Date',
+    'District', 'project', 'Project Manager','location_map', 'Circuit', 'Segment',
+    'team lider', 'PID', 'sourcefile'
+]
+
+def sanitize_sheet_name(name: str) -> str:
+    """
+    Remove or replace invalid characters for Excel sheet names.
+    Excel sheet names cannot contain: : \ / ? * [ ]
+    """
+    name = str(name)
+    name = re.sub(r'[:\\/*?\[\]\n\r]', '_', name)
+    name = re.sub(r'[^\x00-\x7F]', '_', name)
+    return name[:31]
+
+
+def poles_to_word(df: pd.DataFrame) -> BytesIO:
+    doc = Document()
+
+    # Defensive cleaning
+    df = df.astype({c: object for c in df.select_dtypes('category').columns})
+    df = df.replace(
+        to_replace=["nan", "NaN", "None", None],
+        value=""
+    )
+
+    grouped = df.groupby('pole', sort=False)
+
+    for pole, group in grouped:
+        pole_str = str(pole).strip()
+        if not pole_str:
+            continue
+
+        # Ordered set using dict keys (preserves order, removes duplicates)
+        unique_texts = OrderedDict()
+
+        for _, row in group.iterrows():
+            parts = []
+
+            wi = str(row.get('Work instructions', '')).strip()
+            comment = str(row.get('comment', '')).strip()
+
+            if wi:
+                parts.append(wi)
+
+            if comment:
+                parts.append(f"({comment})")
+
+            if parts:
+                text = " ".join(parts)
+
+                # Normalize for deduplication
+                normalized = text.lower().strip()
+
+                unique_texts[normalized] = text
+
+        if not unique_texts:
+            continue
+
+        # Bullet paragraph
+        p = doc.add_paragraph(style='List Bullet')
+
+        run_number = p.add_run(f"{pole_str} – ")
+        run_number.bold = True
+        run_number.font.name = 'Times New Roman'
+        run_number.font.size = Pt(12)
+
+        texts = list(unique_texts.values())
+
+        for i, text in enumerate(texts):
+            run_item = p.add_run(text)
+            run_item.bold = True
+            run_item.font.name = 'Times New Roman'
+            run_item.font.size = Pt(12)
+
+            if "Erect Pole" in text:
+                run_item.font.highlight_color = WD_COLOR_INDEX.RED
+
+            if i < len(texts) - 1:
+                p.add_run(" ; ")
+
+    buffer = BytesIO()
+    doc.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+def build_export_df(filtered_df):
+    export_df = filtered_df.copy()
+
+    # Rename columns
+    export_df = export_df.rename(columns=column_rename_map)
+
+    # Keep only columns that actually exist
+    existing_cols = [c for c in export_columns if c in export_df.columns]
+    export_df = export_df[existing_cols]
+
+    return export_df
+
+# Normalize strings: remove leading/trailing spaces, lowercase, remove extra dots
+def normalize_item(s):
+    if pd.isna(s):
+        return ""
+    s = str(s).strip().lower()           # strip spaces and lowercase
+    s = s.replace(".", "")               # remove dots
+    s = re.sub(r"\s+", " ", s)          # collapse multiple spaces
+    return s
+
+
+def clean_numeric(series):
+    # "1 234,5" style strings → float, anything unparseable → NaN
+    return pd.to_numeric(
+        series.astype(str)
+        .str.replace(" ", "")
+        .str.replace(",", ".", regex=False),
+        errors='coerce'
+    )
+
+# --- Item classification ---
+def per_item(items, fn):
+    """
+    `fn` evaluated once per distinct value of `items` and broadcast back through
+    factorized codes; missing items (code -1) get fn(NaN), stored last.
+    """
+    codes, uniques = pd.factorize(items)
+    values = [fn(u) for u in uniques] + [fn(np.nan)]
+    out = np.empty(len(values), dtype=object)
+    out[:] = values
+    return pd.Series(out[codes], index=items.index)
+
+# Materials categories match when an item contains any of the category's mapping keys
+# (case-insensitive). Each item gets a bitmask, one bit per `categories` entry, since
+# an item may match several categories.
+CATEGORY_BITS = {cat_name: 1 << i for i, (cat_name, _, _) in enumerate(categories)}
+CATEGORY_PATTERNS = [
+    (CATEGORY_BITS[cat_name], re.compile('|'.join(re.escape(k) for k in keys), re.IGNORECASE))
+    for cat_name, keys, _ in categories
+]
+
+def item_category_bits(item):
+    if pd.isna(item):
+        return 0
+    text = str(item)
+    return sum(bit for bit, pattern in CATEGORY_PATTERNS if pattern.search(text))
+
+def item_categories(items):
+    # Category bitmask per row, matched on the distinct items only
+    return per_item(items, item_category_bits).astype(np.uint8)
+
+def category_mask(df, cat_name):
+    # Rows of one materials category; uses the precomputed bitmask when present
+    bits = df['item_categories'] if 'item_categories' in df.columns else item_categories(df['item'])
+    return (bits & CATEGORY_BITS[cat_name]).to_numpy() != 0
+
+def prepare_dataframe(df):
+    df = df.copy()
+    df.columns = df.columns.str.strip().str.lower()
+
+    if 'datetouse' in df.columns:
+        df['datetouse_dt'] = pd.to_datetime(df['datetouse'], errors='coerce')
+        df['datetouse_display'] = df['datetouse_dt'].dt.strftime("%d/%m/%Y")
+        df.loc[df['datetouse_dt'].isna(), 'datetouse_display'] = "Unplanned"
+        df['datetouse_dt'] = df['datetouse_dt'].dt.normalize()
+    else:
+        df['datetouse_dt'] = pd.NaT
+        df['datetouse_display'] = "Unplanned"
+
+    # Second date basis ("Done Only"), parsed here so switching never reparses
+    if 'done' in df.columns:
+        df['done_dt'] = pd.to_datetime(df['done'], errors='coerce').dt.normalize()
+    else:
+        df['done_dt'] = pd.NaT
+
+    # Make numeric columns safe
+    for col in ['total', 'orig']:
+        if col in df.columns:
+            df[col] = clean_numeric(df[col]).astype('float64')
+
+    # Materials: category bitmask and cleaned quantity, once per upload
+    if 'item' in df.columns:
+        df['item_categories'] = item_categories(df['item'])
+    if 'qsub' in df.columns:
+        df['qsub_clean'] = clean_numeric(df['qsub']).astype('float64')
+
+    # Low-cardinality text → categorical (string categories, NaN kept as missing)
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str)).astype('category')
+
+    # Keep rows in date order (unplanned last) so date filters are index slices
+    return df.sort_values('datetouse_dt', kind='stable', na_position='last').reset_index(drop=True)
+
+
+def read_parquet_columns(data: bytes, columns=None, filter=None) -> pd.DataFrame:
+    """
+    Read a parquet file through pyarrow's dataset API, keeping only `columns`.
+    Names are matched and returned stripped/lowercased, like the rest of the dashboard.
+    `filter` is pushed down so row groups whose statistics can't match are skipped.
+    """
+    fragment = ds.ParquetFileFormat().make_fragment(pa.BufferReader(data))
+    names = projected_names(fragment.physical_schema, columns)
+    table = fragment.to_table(columns=names, filter=filter)
+    return table.rename_columns([n.strip().lower() for n in table.column_names]).to_pandas()
+
+def name_tokens(text):
+    # Lowercase alphanumeric words: "Hi5_4_Lanark_2026" → ["hi5", "4", "lanark", "2026"]
+    return re.findall(r"[a-z0-9]+", str(text).lower())
+
+def source_tag(filename):
+    """
+    file_project_mapping key a per-project parquet belongs to: the key's words must
+    appear as consecutive whole words of the file name (longest key wins, so
+    "pcb 2022" beats "pcb"). None when nothing matches.
+    """
+    stem = name_tokens(os.path.splitext(os.path.basename(filename))[0])
+    matches = []
+    for key in file_project_mapping:
+        words = name_tokens(key)
+        if any(stem[i:i + len(words)] == words for i in range(len(stem) - len(words) + 1)):
+            matches.append(key)
+    return max(matches, key=len) if matches else None
+
+def tag_source(table: pa.Table, filename) -> pa.Table:
+    # Stamp every row of a per-project file with its mapping key in `sourcefile`;
+    # an already merged master (no matching key) keeps its own sourcefile values.
+    # Callers only tag when several files were uploaded together.
+    tag = source_tag(filename)
+    if tag is None:
+        return table
+    sourcefile = pa.array([tag] * table.num_rows, pa.string())
+    if 'sourcefile' in table.column_names:
+        return table.set_column(table.column_names.index('sourcefile'), 'sourcefile', sourcefile)
+    return table.append_column('sourcefile', sourcefile)
+
+def read_master_table(name, data: bytes, columns=None, filter_for=None, tag=True) -> pa.Table:
+    """
+    One uploaded master as an Arrow table: projected, pushdown-filtered
+    (`filter_for(schema)` builds the expression), columns stripped/lowercased
+    and, with `tag`, `sourcefile` tagged from file_project_mapping.
+    """
+    fragment = ds.ParquetFileFormat().make_fragment(pa.BufferReader(data))
+    schema = fragment.physical_schema
+    names = projected_names(schema, columns)
+    table = fragment.to_table(columns=names, filter=filter_for(schema) if filter_for else None)
+    table = table.rename_columns([n.strip().lower() for n in table.column_names])
+    return tag_source(table, name) if tag else table
+
+def read_masters(sources, columns=None, filter_for=None, max_workers=None) -> pd.DataFrame:
+    """
+    Decode several (name, bytes) parquet masters concurrently and stack them.
+    pyarrow releases the GIL while decoding, so a thread pool scales with cores;
+    the tables are concatenated without copying before the single pandas conversion.
+    Rows are tagged with their file's project key only when several files are given.
+    """
+    sources = list(sources)
+    tag = len(sources) > 1
+    workers = max_workers or min(len(sources), os.cpu_count() or 1) or 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        tables = list(pool.map(lambda src: read_master_table(src[0], src[1], columns, filter_for, tag), sources))
+    if not tables:
+        return pd.DataFrame()
+    # Per-project files can disagree on string widths or miss optional columns
+    return pa.concat_tables(tables, promote_options="permissive").to_pandas()
+
+def projected_names(schema, columns=None):
+    # Physical column names whose strip/lower form is wanted (all when columns is None)
+    if columns is None:
+        return schema.names
+    wanted = set(columns)
+    return [n for n in schema.names if n.strip().lower() in wanted]
+
+def master_filter(schema, shires=None, projects=None, start=None, end=None, date_column='datetouse'):
+    """
+    Pushdown expression for shire / project / date-range selections.
+    `None` or "All" leaves a dimension open; returns None when nothing narrows the read.
+    `date_column` is the raw Master column the range applies to (datetouse or done).
+    """
+    fields = {n.strip().lower(): n for n in schema.names}
+    conditions = []
+
+    for col, values in [('shire', shires), ('project', projects)]:
+        if values and "All" not in values and col in fields:
+            conditions.append(ds.field(fields[col]).isin(list(values)))
+
+    # Date statistics are only comparable when the column is stored as a date/timestamp
+    if date_column in fields and pa.types.is_temporal(schema.field(fields[date_column]).type):
+        date_field = ds.field(fields[date_column])
+        if start is not None:
+            conditions.append(date_field >= pa.scalar(pd.Timestamp(start)))
+        if end is not None:
+            conditions.append(date_field < pa.scalar(pd.Timestamp(end) + pd.Timedelta(days=1)))
+
+    if not conditions:
+        return None
+    expr = conditions[0]
+    for condition in conditions[1:]:
+        expr = expr & condition
+    return expr
+
+
+def build_filter_index(df, columns):
+    """
+    Inverted index for the sidebar multiselects.
+    Per column: sorted labels, the row code array, and row ids grouped by label
+    (rows[offsets[i]:offsets[i + 1]] are the rows holding labels[i]).
+    """
+    index = {}
+    for col in columns:
+        if col not in df.columns:
+            continue
+        values = df[col]
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.where(values.isna(), values.astype(str)).astype('category')
+        codes = values.cat.codes.to_numpy()
+        labels = [str(c) for c in values.cat.categories]
+
+        # Missing values (code -1) sort first and are never part of a posting list
+        counts = np.bincount(codes + 1, minlength=len(labels) + 1)
+        offsets = np.cumsum(counts)
+        index[col] = {
+            'labels': labels,
+            'positions': {label: i for i, label in enumerate(labels)},
+            'codes': codes,
+            'rows': np.argsort(codes, kind='stable'),
+            'offsets': offsets,
+        }
+    return index
+
+def index_options(entry, mask):
+    """Sorted labels still present among the rows set in `mask`."""
+    present = np.bincount(entry['codes'][mask] + 1, minlength=len(entry['labels']) + 1)[1:] > 0
+    return [label for label, keep in zip(entry['labels'], present) if keep]
+
+def index_mask(entry, selected, n_rows):
+    """Row bitmap for the union of the selected labels' posting lists."""
+    mask = np.zeros(n_rows, dtype=bool)
+    for label in selected:
+        i = entry['positions'].get(label)
+        if i is not None:
+            mask[entry['rows'][entry['offsets'][i]:entry['offsets'][i + 1]]] = True
+    return mask
+
+def build_date_index(dates):
+    """
+    Integer day / month / year keys for a date column sorted ascending with NaT last.
+    Rows from `n_dated` onwards are the unplanned (NaT) block.
+    """
+    n_dated = int(dates.notna().sum())
+    values = dates.to_numpy()[:n_dated]
+    return {
+        'n_dated': n_dated,
+        'D': values.astype('datetime64[D]').astype(np.int64),
+        'M': values.astype('datetime64[M]').astype(np.int64),
+        'Y': values.astype('datetime64[Y]').astype(np.int64),
+    }
+
+def date_rows(date_index, unit, first, last):
+    """
+    Row range [start, stop) whose dates fall between `first` and `last` (inclusive)
+    at day ('D'), month ('M') or year ('Y') resolution. Two binary searches, no scan.
+    """
+    keys = date_index[unit]
+    lo = np.datetime64(pd.Timestamp(first).date(), unit).astype(np.int64)
+    hi = np.datetime64(pd.Timestamp(last).date(), unit).astype(np.int64)
+    start = int(np.searchsorted(keys, lo, side='left'))
+    stop = int(np.searchsorted(keys, hi, side='right'))
+    return start, max(start, stop)
+
+def build_rollup_cube(df, date_column='datetouse_dt'):
+    """
+    Daily rollup of total, orig, variation (total - orig) and row counts over
+    date × CUBE_DIMENSIONS, sorted by date with unplanned (NaT) last like the rows.
+    The date key is always called datetouse_dt, whichever basis `date_column` is.
+    """
+    keys = ['datetouse_dt'] + [c for c in CUBE_DIMENSIONS if c in df.columns]
+    has_total = 'total' in df.columns
+    has_orig = has_total and 'orig' in df.columns
+    values = df[[c for c in keys if c != 'datetouse_dt']].assign(
+        datetouse_dt=df[date_column],
+        total=df['total'] if has_total else np.nan,
+        orig=df['orig'] if has_orig else np.nan,
+        variation=(df['total'] - df['orig']) if has_orig else np.nan,
+    )
+    cube = (
+        values
+        .groupby(keys, observed=True, dropna=False, sort=False)
+        .agg(total=('total', 'sum'), orig=('orig', 'sum'), variation=('variation', 'sum'), rows=('total', 'size'))
+        .reset_index()
+    )
+    return cube.sort_values('datetouse_dt', kind='stable', na_position='last').reset_index(drop=True)
+
+def build_date_view(df, date_column):
+    """
+    Structures for one date basis over the planned-date-sorted master rows:
+    `order` (None when already sorted by this basis, else the row permutation
+    that sorts it), the date index, and the rollup cube with its date index.
+    """
+    dates = df[date_column]
+    order = None
+    if date_column != 'datetouse_dt':
+        order = dates.sort_values(kind='stable', na_position='last').index.to_numpy()
+        dates = dates.iloc[order]
+
+    cube = build_rollup_cube(df, date_column)
+    return {
+        'date_column': date_column,
+        'order': order,
+        'date_index': build_date_index(dates),
+        'cube': cube,
+        'cube_date_index': build_date_index(cube['datetouse_dt']),
+    }
+
+
+def iter_row_groups(data: bytes, columns=None, filter=None, name=None):
+    """
+    Yield a parquet file one row group at a time as pandas frames.
+    Row groups whose statistics rule out `filter` are never decoded, so peak
+    memory is a single row group however large the file is.
+    With `name`, batches are tagged like read_master_table does.
+    """
+    fragment = ds.ParquetFileFormat().make_fragment(pa.BufferReader(data))
+    names = projected_names(fragment.physical_schema, columns)
+    for row_group in fragment.split_by_row_group(filter):
+        table = row_group.to_table(columns=names, filter=filter)
+        if table.num_rows:
+            if name is not None:
+                table = tag_source(table.rename_columns([n.strip().lower() for n in table.column_names]), name)
+            yield table.to_pandas()
+
+def filter_batch(df, spec):
+    """
+    Apply a streaming filter spec (shires, projects, date_column, start, end) to a
+    normalized batch. The spec's date basis is exposed as datetouse_dt.
+    """
+    df = df.assign(datetouse_dt=df[spec['date_column']])
+    mask = pd.Series(True, index=df.index)
+    for col, selected in [('shire', spec['shires']), ('project', spec['projects'])]:
+        if selected and col in df.columns:
+            mask &= df[col].isin(selected)
+    if spec['start'] is not None:
+        mask &= df['datetouse_dt'] >= pd.Timestamp(spec['start'])
+    if spec['end'] is not None:
+        mask &= df['datetouse_dt'] <= pd.Timestamp(spec['end'])
+    return df[mask]
+
+def stream_batches(sources, spec):
+    # Generator pipeline: file → row group → normalize → filter; nothing is held between steps.
+    # Like read_masters, rows are tagged with their file's project key only for several files.
+    sources = list(sources)
+    tag = len(sources) > 1
+    for name, data in sources:
+        schema = ds.ParquetFileFormat().make_fragment(pa.BufferReader(data)).physical_schema
+        pushdown = master_filter(schema, spec['shires'], spec['projects'], spec['start'], spec['end'],
+                                 RAW_DATE_COLUMNS[spec['date_column']])
+        for batch in iter_row_groups(data, MASTER_COLUMNS, pushdown, name if tag else None):
+            batch = filter_batch(prepare_dataframe(batch), spec)
+            if not batch.empty:
+                yield batch
+
+def add_partial(acc, part):
+    return part if acc is None else acc.add(part, fill_value=0)
+
+def stream_aggregates(batches):
+    """
+    Fold filtered batches into the totals, revenue-over-time and materials aggregates.
+    Only these partial sums are kept between row groups.
+    """
+    result = {'rows': 0, 'total': 0.0, 'variation': 0.0, 'revenue': None, 'materials': {}}
+    for batch in batches:
+        result['rows'] += len(batch)
+        if 'total' in batch.columns:
+            result['total'] += batch['total'].sum()
+            if 'orig' in batch.columns:
+                result['variation'] += (batch['total'] - batch['orig']).sum()
+            dated = batch.dropna(subset=['datetouse_dt'])
+            result['revenue'] = add_partial(result['revenue'], dated.groupby('datetouse_dt')['total'].sum())
+
+        if 'item' not in batch.columns or 'mapped' not in batch.columns:
+            continue
+        for cat_name, _, _ in categories:
+            sub_df = batch[category_mask(batch, cat_name)]
+            if sub_df.empty:
+                continue
+            if 'qsub_clean' in sub_df.columns:
+                part = sub_df.groupby('mapped')['qsub_clean'].sum()
+            else:
+                part = sub_df['mapped'].value_counts()
+            result['materials'][cat_name] = add_partial(result['materials'].get(cat_name), part)
+    return result
+
+def stream_rows(batches, cat_name, mapped):
+    # Materialize only the drill-down rows: one materials category and mapping label
+    parts = [b[category_mask(b, cat_name) & (b['mapped'] == mapped).to_numpy()] for b in batches]
+    parts = [p for p in parts if not p.empty]
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+
+# --- Excel writer ---
+# Exports stream through xlsxwriter in constant_memory mode: each row is flushed to
+# disk as soon as the next one starts, and every cell shares one of a handful of
+# workbook formats instead of carrying its own Border/Fill objects.
+
+EXCEL_OPTIONS = {
+    'constant_memory': True,
+    'strings_to_formulas': False,
+    'strings_to_urls': False,
+    'nan_inf_to_errors': True,
+}
+EXCEL_DATE_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+
+THIN, MEDIUM, THICK = 1, 2, 5
+
+def excel_workbook(buffer):
+    return xlsxwriter.Workbook(buffer, EXCEL_OPTIONS)
+
+def excel_formats(workbook, header_size=16):
+    """
+    Shared formats for one workbook. `header_size=None` gives the plain pandas-like
+    header (bold, thin border) with unbanded data, used by the unbranded exports.
+    header: formats for [first, middle, last, only] column; band: {grey, white} × {plain, date}.
+    """
+    if header_size is None:
+        header = workbook.add_format({'bold': True, 'border': THIN, 'align': 'center', 'valign': 'top'})
+        date = workbook.add_format({'num_format': EXCEL_DATE_FORMAT})
+        plain = {'plain': None, 'date': date}
+        return {'header': [header] * 4, 'band': {True: plain, False: plain}}
+
+    def header(left, right):
+        return workbook.add_format({
+            'bold': True, 'font_size': header_size, 'bg_color': '#00CCFF',
+            'left': left, 'right': right, 'top': THICK, 'bottom': THICK,
+        })
+
+    def band(color):
+        base = {'bg_color': color, 'border': THIN}
+        return {
+            'plain': workbook.add_format(base),
+            'date': workbook.add_format({**base, 'num_format': EXCEL_DATE_FORMAT}),
+        }
+
+    return {
+        'header': [header(THICK, MEDIUM), header(MEDIUM, MEDIUM), header(MEDIUM, THICK), header(THICK, THICK)],
+        'band': {True: band('#D9D9D9'), False: band('#FFFFFF')},
+    }
+
+def excel_rows(df, chunk_rows=10_000):
+    # Native Python values row by row (NaN/NaT → None), converting a chunk at a time
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows].astype(object)
+        yield from chunk.where(chunk.notna(), None).values.tolist()
+
+def write_frame(ws, formats, df, header=None, first_row=1, grey_parity=1):
+    """
+    Write `df` below `first_row` (0-based; row 0 is left for the logos).
+    `header` is a list of header rows (default: the column names). Data rows whose
+    1-based Excel row number has parity `grey_parity` are grey, the rest white.
+    Returns the width written.
+    """
+    header = [list(df.columns)] if header is None else header
+    width = max([len(df.columns)] + [len(labels) for labels in header])
+    edges = [0] + [1] * (width - 2) + [2] if width > 1 else [3]
+
+    row = first_row
+    for labels in header:
+        for col in range(width):
+            ws.write(row, col, labels[col] if col < len(labels) else None, formats['header'][edges[col]])
+        row += 1
+
+    padding = [None] * (width - len(df.columns))
+    for values in excel_rows(df):
+        band = formats['band'][(row + 1) % 2 == grey_parity]
+        for col, value in enumerate(values + padding):
+            fmt = band['date'] if isinstance(value, (datetime, date)) else band['plain']
+            ws.write(row, col, value, fmt)
+        row += 1
+    return width
+
+@lru_cache(maxsize=None)
+def logo_png(path, width, height):
+    # Decoded and resized once per process; every sheet and workbook reuses the bytes
+    with Image.open(path) as img:
+        resized = img.convert("RGBA").resize((width, height), Image.LANCZOS)
+    out = BytesIO()
+    resized.save(out, format="PNG")
+    return out.getvalue()
+
+def insert_logos(ws, small_anchor="B1", large_anchor="A1", height=120, small_width=120):
+    # Gaeltec logo (square) and SPEN logo (3× wide) at their final pixel sizes
+    for path, anchor, width in [(GAELTEC_LOGO, small_anchor, small_width),
+                                (SPEN_LOGO, large_anchor, small_width * 3)]:
+        ws.insert_image(anchor, os.path.basename(path), {'image_data': BytesIO(logo_png(path, width, height))})
+
+def branded_sheet(workbook, formats, sheet_name, df=None, header=None, logo_row=90,
+                  widths=(60, 20), anchors=("B1", "A1"), grey_parity=1):
+    """
+    Add one branded sheet: logo row, header from row 2 and banded data below it.
+    `widths` is (first column, remaining columns); `anchors` is (Gaeltec, SPEN).
+    With `df=None` only the logo row is written.
+    """
+    ws = workbook.add_worksheet(sheet_name)
+    ws.set_row(0, logo_row)
+    if df is not None:
+        width = write_frame(ws, formats, df, header=header, grey_parity=grey_parity)
+        ws.set_column(0, 0, widths[0])
+        ws.set_column(1, max(width - 1, 1), widths[1])
+    insert_logos(ws, small_anchor=anchors[0], large_anchor=anchors[1])
+    return ws
+
+def unique_sheet_name(workbook, name):
+    # Sanitized names can collide after truncation; xlsxwriter rejects duplicates
+    taken = {ws.get_name().lower() for ws in workbook.worksheets()}
+    candidate, n = name, 2
+    while candidate.lower() in taken:
+        suffix = f"_{n}"
+        candidate, n = name[:31 - len(suffix)] + suffix, n + 1
+    return candidate
+
+
+# --- Columnar writer ---
+# CSV / Parquet / Arrow IPC straight from one Arrow table; no per-cell Python work.
+
+COLUMNAR_FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.file'),
+}
+
+def arrow_table(df) -> pa.Table:
+    """
+    `df` as an Arrow table. Object columns that don't convert as-is (dates mixed with
+    "Unplanned", numbers mixed with text) are written as strings, missing values kept.
+    Column names must be unique.
+    """
+    duplicated = df.columns[df.columns.duplicated()]
+    if len(duplicated):
+        raise ValueError(f"Duplicate column names can't be exported: {sorted(set(map(str, duplicated)))}")
+    arrays = []
+    for name in df.columns:
+        col = df[name]
+        try:
+            arrays.append(pa.array(col, from_pandas=True))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array(col.astype(str).where(col.notna()), from_pandas=True))
+    return pa.Table.from_arrays(arrays, names=[str(c) for c in df.columns])
+
+def columnar_export(df, fmt) -> BytesIO:
+    table = arrow_table(df)
+    buffer = BytesIO()
+    if fmt == 'csv':
+        pa_csv.write_csv(table, buffer)
+    elif fmt == 'parquet':
+        pq.write_table(table, buffer)
+    elif fmt == 'arrow':
+        with pa.ipc.new_file(buffer, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        raise ValueError(f"Unknown columnar format: {fmt}")
+    buffer.seek(0)
+    return buffer
+
+
+# --- Paged table views ---
+# Drill-down tables are filtered, sorted and sliced in Arrow; only one page becomes pandas.
+
+def arrow_view(df) -> pa.Table:
+    # arrow_table with dictionary (categorical) columns decoded so they sort and filter as text
+    table = arrow_table(df)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            column = pa.chunked_array([c.dictionary_decode() for c in table.column(i).chunks],
+                                      type=field.type.value_type)
+            table = table.set_column(i, field.name, column)
+    return table
+
+def table_page(table, sort_by=None, descending=False, filter_column=None, filter_text="",
+               page=1, page_size=100):
+    """
+    One page (1-based, clamped to the last page) of `table` after a case-insensitive
+    "contains" filter on one column and an optional sort.
+    Returns (page as pandas, matching row count, page number used).
+    """
+    if filter_column and filter_text:
+        text = pc.cast(table[filter_column], pa.string())
+        table = table.filter(pc.fill_null(pc.match_substring(text, filter_text, ignore_case=True), False))
+
+    n_rows = table.num_rows
+    last_page = max(1, -(-n_rows // page_size))
+    page = min(max(1, int(page)), last_page)
+    start = (page - 1) * page_size
+
+    if sort_by:
+        order = 'descending' if descending else 'ascending'
+        indices = pc.sort_indices(table, sort_keys=[(sort_by, order, 'at_end')])
+        rows = table.take(indices.slice(start, page_size))
+    else:
+        rows = table.slice(start, page_size)
+    return rows.to_pandas(), n_rows, page
+
+
+def to_excel(project_df, team_df):
+    output = BytesIO()
+    workbook = excel_workbook(output)
+    formats = excel_formats(workbook, header_size=14)
+
+    # ---- Sheet 1: Revenue per Project / Sheet 2: Revenue per Team ----
+    # Header → row 2, data → row 3 (even rows grey)
+    for df, sheet_name, first_width in [(project_df, "Revenue per Project", 30),
+                                        (team_df, "Revenue per Team", 25)]:
+        if not df.empty:
+            branded_sheet(workbook, formats, sheet_name, df, logo_row=120,
+                          widths=(first_width, 18), anchors=("A1", "B1"), grey_parity=0)
+
+    workbook.close()
+    output.seek(0)
+    return output
+
+def generate_excel_styled_multilevel(filtered_df, poles_df=None):
+    output = BytesIO()
+    workbook = excel_workbook(output)
+    formats = excel_formats(workbook)
+
+    # ---- Sheet 1: Daily Revenue ----
+    daily_df = None
+    if {'shire', 'project','region','segmentdesc', 'segmentcode', 'projectmanager', 'datetouse_dt', 'total'}.issubset(filtered_df.columns):
+        daily_df = (
+            filtered_df
+            .groupby(['datetouse_dt','shire','project','region','segmentdesc','segmentcode','projectmanager'], as_index=False, observed=True)
+            .agg({'total':'sum'})
+        )
+        daily_df.rename(columns={
+            'datetouse_dt':'Date',
+            'total':'Revenue (£)',
+            'region':'location',
+            'segmentdesc':'Detail',
+            'segmentcode':'Circuit',
+            'projectmanager':'Project Manager'
+        }, inplace=True)
+
+    # Header in ROW 2 (row 1 reserved for images), data from row 3
+    branded_sheet(workbook, formats, "Daily Revenue", daily_df)
+
+    # ---- Sheet 2: Poles Summary ----
+    poles_summary, headers = None, None
+    if poles_df is not None and not poles_df.empty:
+        poles_summary = (
+            poles_df[['shire','project','segmentcode','pole']]
+            .drop_duplicates()
+            .groupby(['shire','project','segmentcode'], as_index=False, observed=True)
+            .agg({'pole': lambda x: ', '.join(sorted(x.astype(str)))})
+        )
+        poles_summary.rename(columns={'pole':'Poles', 'segmentcode':'Segment'}, inplace=True)
+
+        # Multi-level headers (Row 2-4): Shire / Project / Segment levels, data from row 5
+        headers = ['Shire','Project','Segment','location_map','Poles']
+        sub_headers = [h if h != 'Poles' else '' for h in headers]
+        headers = [headers, sub_headers, sub_headers]
+    branded_sheet(workbook, formats, "Poles Summary", poles_summary, header=headers, anchors=("A1", "B1"))
+
+    workbook.close()
+    output.seek(0)
+    return output
+
+
+# --- Output Details summary ---
+# Summary column → item descriptions counted in it. "Poles Refurb" is derived from poles instead.
+SUMMARY_BUCKETS = {
+    "Erect Poles": list(pole_erected_keys),
+    "Recover Poles": list(poles_replaced_keys),
+    "PTE Installed 1ph": ["Transformer 1ph 50kVA", "Transformer 1ph 100kVA", "Transformer 1ph 25kVA"],
+    "PTE Installed 3ph": ["Transformer 3ph 50kVA", "Transformer 3ph 200kVA", "Transformer 3ph 100kVA"],
+    "Conductor HV Installed (Km)": list(conductor_keys),
+    "Conductor LV Installed (Km)": list(conductor_2_keys),
+    "Noja": ["Noja", "0.5 kVa Tx for Noja"],
+    "Soule": ["11kV PMSW (Soule)"],
+    "ABSW": [
+        "11kv ABSW Hookstick Standard",
+        "11kv ABSW Hookstick Spring loaded mech",
+        "33kv ABSW Hookstick Dependant",
+    ],
+    "11 kV fuse": [
+        "Erect 3.ph fuse units at single tee off pole or in line pole.",
+        "Erect 1.ph fuse units at single tee off pole or in line pole.",
+    ],
+}
+POLE_WORK_BUCKETS = ["Erect Poles", "Recover Poles"]
+SUMMARY_COLUMNS = (["Project"] + POLE_WORK_BUCKETS + ["Poles Refurb"]
+                   + [c for c in SUMMARY_BUCKETS if c not in POLE_WORK_BUCKETS] + ["Total Value (£)"])
+
+# Normalized item → summary column; no item belongs to two columns
+SUMMARY_BUCKET_OF = {normalize_item(item): bucket for bucket, items in SUMMARY_BUCKETS.items() for item in items}
+
+def summary_buckets(items):
+    # One categorization pass: each row's summary column (None when it counts in none)
+    return per_item(items, lambda item: SUMMARY_BUCKET_OF.get(normalize_item(item)))
+
+def refurb_poles(df):
+    """
+    (project, pole) pairs with no Erect/Recover row, from a frame carrying
+    `summary_bucket`. Poles are compared stripped, like the rest of the export.
+    """
+    poles = pd.DataFrame({
+        'project': df['project'],
+        'pole': df['pole'].astype('string').str.strip(),
+        'pole_work': df['summary_bucket'].isin(POLE_WORK_BUCKETS),
+    }).dropna(subset=['pole'])
+    worked = poles.groupby(['project', 'pole'], observed=True)['pole_work'].any()
+    return worked[~worked]
+
+def project_summary(df):
+    """
+    Per-project Summary sheet (plus a Total row) from one groupby over the
+    categorized rows, instead of one scan per project and column.
+    """
+    quantities = pd.DataFrame({
+        bucket: df['Quantity_used'].where(df['summary_bucket'] == bucket, 0)
+        for bucket in SUMMARY_BUCKETS
+    })
+    summary = quantities.groupby(df['project'], observed=True).sum()
+    summary["Poles Refurb"] = (
+        refurb_poles(df).groupby(level='project', observed=True).size()
+        .reindex(summary.index, fill_value=0)
+    )
+    if "total" in df.columns:
+        summary["Total Value (£)"] = pd.to_numeric(df["total"], errors="coerce").fillna(0).groupby(df["project"], observed=True).sum()
+    else:
+        summary["Total Value (£)"] = 0
+
+    final_summary = (
+        summary.rename_axis("Project").reset_index()
+        .astype({"Project": object})[SUMMARY_COLUMNS]
+        .sort_values("Project")
+    )
+
+    # --- Add Total Row ---
+    total_row = final_summary.select_dtypes(include='number').sum().to_dict()
+    total_row["Project"] = "Total"  # Label for the total row
+    return pd.concat([final_summary, pd.DataFrame([total_row])], ignore_index=True)
+
+def breakdown_masks(df):
+    """
+    (summary column, row mask) for each breakdown sheet, in Summary order.
+    Poles Refurb rows are those on poles never erected or recovered anywhere in `df`.
+    """
+    for col_name in SUMMARY_COLUMNS[1:-1]:
+        if col_name == "Poles Refurb":
+            worked = set(df.loc[df['summary_bucket'].isin(POLE_WORK_BUCKETS), 'pole']
+                         .dropna().astype(str).str.strip())
+            all_poles = set(df['pole'].dropna().astype(str).str.strip())
+            yield col_name, df['pole'].isin(all_poles - worked)
+        else:
+            yield col_name, df['summary_bucket'] == col_name
+
+
+def output_details_frame(filtered_df):
+    # Rows and columns of the "Output" sheet, shared by the workbook and columnar exports
+    export_df = filtered_df.copy()
+    export_df = export_df.rename(columns=column_rename_map)
+
+    if "done" in export_df.columns:
+        export_df["done"] = pd.to_datetime(export_df["done"], errors="coerce")
+        export_df["done_display"] = export_df["done"].dt.strftime("%d/%m/%Y")
+        export_df.loc[export_df["done"].isna(), "done_display"] = "Unplanned"
+
+    cols_to_include = [
+        "item","comment", "Quantity_original", "Quantity_used", "material_code",
+        "type", "pole", "datetouse_dt", "District", "project",
+        "Project Manager","location_map", "Circuit", "Segment",
+        "team lider","total", "PID", "sourcefile"
+    ]
+    cols_to_include = [c for c in cols_to_include if c in export_df.columns]
+    export_df = export_df[cols_to_include]
+    return export_df
+
+def build_output_workbook(filtered_df) -> BytesIO:
+    """
+    "Output Details" workbook: Output rows, per-project Summary and one
+    breakdown sheet per Summary column.
+    """
+    buffer_agg = BytesIO()
+    workbook = excel_workbook(buffer_agg)
+    formats = excel_formats(workbook)
+
+    export_df = output_details_frame(filtered_df)
+
+    # ---- Output sheet (start below images) ----
+    branded_sheet(workbook, formats, "Output", export_df)
+
+    # ---- Summary sheet ----
+    if "Quantity_used" in export_df.columns:
+        export_df["Quantity_used"] = pd.to_numeric(export_df["Quantity_used"], errors="coerce").fillna(0)
+        export_df["summary_bucket"] = summary_buckets(export_df["item"])
+
+        branded_sheet(workbook, formats, "Summary", project_summary(export_df), anchors=("A1", "B1"))
+
+        # ---- Breakdown sheets per summary column ----
+        # Columns to include
+        cols_to_include = [
+            "item","comment","Quantity_used","material_code","pole","datetouse_dt","done_display",
+            "District", "project","Project Manager","location_map","Circuit","Segment"
+        ]
+        cols_to_include = [c for c in cols_to_include if c in export_df.columns]
+        for col_name, mask in breakdown_masks(export_df):
+            sheet_name = col_name[:31]  # Excel sheet name max 31 chars
+            branded_sheet(workbook, formats, sheet_name, export_df.loc[mask, cols_to_include])
+
+    workbook.close()
+    buffer_agg.seek(0)
+    return buffer_agg
+
+# location_map region → ward, expanded once; unknown regions are their own ward
+REGION_WARDS = pd.DataFrame(
+    [(region, ward) for region, wards in mapping_region.items() for ward in wards],
+    columns=['location_map', 'ward'],
+).drop_duplicates(ignore_index=True)
+
+def ward_activity(df, wards=None):
+    """
+    Revenue (`total`) and row count per ward for the map choropleth: one groupby by
+    location_map, then a join to REGION_WARDS, keeping only names in `wards` (the
+    map's ward names; every ward when None). A region's revenue and rows are split
+    evenly over its kept wards, so ward figures add up to the filtered totals of
+    mapped regions; `rows` is therefore fractional.
+    """
+    if df.empty or 'location_map' not in df.columns:
+        return pd.DataFrame(columns=['revenue', 'rows'], index=pd.Index([], name='ward'))
+    revenue = df['total'] if 'total' in df.columns else pd.Series(0.0, index=df.index)
+    by_region = (
+        pd.DataFrame({'location_map': df['location_map'].astype(object), 'revenue': revenue, 'rows': 1})
+        .dropna(subset=['location_map'])
+        .groupby('location_map', as_index=False)[['revenue', 'rows']].sum()
+        .merge(REGION_WARDS, on='location_map', how='left')
+    )
+    by_region['ward'] = by_region['ward'].fillna(by_region['location_map'])
+    if wards is not None:
+        by_region = by_region[by_region['ward'].isin(list(wards))]
+    n_wards = by_region.groupby('location_map')['ward'].transform('size')
+    by_region = by_region.assign(revenue=by_region['revenue'] / n_wards, rows=by_region['rows'] / n_wards)
+    return by_region.groupby('ward')[['revenue', 'rows']].sum()
+
+def revenue_tables(rollup_df):
+    """
+    Revenue per project and per team (largest first) from a rollup cube slice.
+    A table is empty when its column or `total` is missing.
+    """
+    if not rollup_df.empty and 'project' in rollup_df.columns and 'total' in rollup_df.columns:
+        revenue_per_project = (
+            rollup_df
+            .groupby('project', as_index=False, observed=True)['total']
+            .sum()
+            .sort_values('total', ascending=False)
+        )
+        revenue_per_project.rename(columns={'total': 'Revenue (£)'}, inplace=True)
+    else:
+        revenue_per_project = pd.DataFrame()
+
+    if not rollup_df.empty and 'team_name' in rollup_df.columns and 'total' in rollup_df.columns:
+        revenue_per_team = (
+            rollup_df
+            .groupby('team_name', as_index=False, observed=True)['total']
+            .sum()
+            .sort_values('total', ascending=False)
+        )
+        revenue_per_team.rename(columns={'team_name': 'Team', 'total': 'Revenue (£)'}, inplace=True)
+    else:
+        revenue_per_team = pd.DataFrame()
+
+    return revenue_per_project, revenue_per_team
+
+def materials_category(df, cat_name):
+    """
+    Rows of one materials category and the per-mapping totals behind its bar chart,
+    from the bitmask and qsub_clean that prepare_dataframe computed.
+    """
+    sub_df = df[category_mask(df, cat_name)]
+    if 'qsub_clean' in sub_df.columns:
+        bar_data = sub_df.groupby('mapped')['qsub_clean'].sum().reset_index()
+    else:
+        bar_data = sub_df['mapped'].value_counts().reset_index()
+    bar_data.columns = ['Mapped', 'Total']
+    return sub_df, bar_data
+
+def mapping_groups(sub_df, bar_data):
+    """
+    `sub_df` without duplicate columns, plus (label, row positions) for each bar label
+    in bar order, from one groupby pass instead of one filter per label.
+    """
+    df = sub_df.loc[:, ~sub_df.columns.duplicated()]
+    indices = df.groupby('mapped', sort=False).indices
+    return df, [(label, indices[label]) for label in bar_data['Mapped'] if label in indices]
+
+def group_positions(groups):
+    return np.concatenate([pos for _, pos in groups]) if groups else np.array([], dtype=np.intp)
+
+def materials_aggregated_frame(sub_df, bar_data):
+    # Every mapping's rows (in bar order) with the display columns of the "Aggregated" sheet
+    df, groups = mapping_groups(sub_df, bar_data)
+    df = df.iloc[group_positions(groups)].reset_index(drop=True)
+    if 'datetouse' in df.columns:
+        dates = pd.to_datetime(df['datetouse'], errors='coerce').dt.strftime("%d/%m/%Y")
+        df = df.assign(datetouse_display=dates.where(df['datetouse'].notna(), "Unplanned"))
+
+    # 🔥 Rename columns BEFORE selecting
+    df = df.rename(columns=column_rename_map)
+
+    cols_to_include = ['Output','Quantity','material_code','pole','Date','District','project','Project Manager','Circuit','Segment','team lider','PID', 'sourcefile']
+    cols_to_include = [c for c in cols_to_include if c in df.columns]
+    return df[cols_to_include]
+
+def materials_aggregated_excel(sub_df, bar_data) -> BytesIO:
+    # One branded "Aggregated" sheet with every mapping's rows
+    buffer_agg = BytesIO()
+    workbook = excel_workbook(buffer_agg)
+    formats = excel_formats(workbook)
+
+    branded_sheet(workbook, formats, 'Aggregated', materials_aggregated_frame(sub_df, bar_data))
+
+    workbook.close()
+    buffer_agg.seek(0)
+    return buffer_agg
+
+def separated_view(sub_df, bar_data, extra_cols):
+    # "Separated" columns for all of sub_df, with the display date computed once
+    df, groups = mapping_groups(sub_df, bar_data)
+    if 'datetouse' in df.columns:
+        dates = pd.to_datetime(df['datetouse'], errors='coerce').astype(object)
+        df = df.assign(datetouse_display=dates.where(df['datetouse'].notna(), "Unplanned"))
+
+    cols_to_include = ['mapped', 'datetouse_display','qsub'] + extra_cols
+    cols_to_include = [c for c in cols_to_include if c in df.columns]
+    return df[cols_to_include], groups
+
+def materials_separated_frames(sub_df, bar_data, extra_cols):
+    # (mapping label, rows) for each sheet of the "Separated" export
+    view, groups = separated_view(sub_df, bar_data, extra_cols)
+    for bar_value, positions in groups:
+        yield bar_value, view.iloc[positions]
+
+def materials_separated_frame(sub_df, bar_data, extra_cols):
+    # All "Separated" sheets stacked; the `mapped` column says which sheet a row came from
+    view, groups = separated_view(sub_df, bar_data, extra_cols)
+    return view.iloc[group_positions(groups)].reset_index(drop=True)
+
+def materials_separated_excel(sub_df, bar_data, extra_cols) -> BytesIO:
+    # One sheet per mapping label
+    buffer_sep = BytesIO()
+    workbook = excel_workbook(buffer_sep)
+    formats = excel_formats(workbook, header_size=None)
+
+    for bar_value, df_bar in materials_separated_frames(sub_df, bar_data, extra_cols):
+        ws = workbook.add_worksheet(unique_sheet_name(workbook, sanitize_sheet_name(bar_value)))
+        write_frame(ws, formats, df_bar, first_row=0)
+
+    workbook.close()
+    buffer_sep.seek(0)
+    return buffer_sep
+
+def build_poles_df(filtered_df, misc_df):
+    """
+    Pole rows joined to their work instructions (miscellaneous.parquet column_1 → column_2),
+    keeping rows that have an instruction, a comment and a team.
+    """
+    item_to_column_i = (
+        misc_df.assign(column_1=misc_df['column_1'].astype(str))
+        .set_index('column_1')['column_2']
+        .to_dict()
+    )
+    poles_df = filtered_df[filtered_df['pole'].notna() & (filtered_df['pole'].astype(str).str.lower() != "nan")].copy()
+    poles_df['item'] = poles_df['item'].astype(str)
+    poles_df['Work instructions'] = poles_df['item'].map(item_to_column_i)
+
+    return poles_df.dropna(subset=['Work instructions', 'comment', 'team_name'])[
+        ['pole', 'segmentcode', 'Work instructions', 'comment', 'team_name']
+    ]
+
+
+# --- Export bundles ---
+
+# Same detail columns the dashboard puts on the "Separated" materials sheets
+MATERIALS_EXTRA_COLUMNS = ['team lider', 'shire', 'project', 'projectmanager', 'segmentcode',
+                           'segmentdesc', 'material_code', 'pid_ohl_nr', 'sourcefile']
+
+def bundle_dirname(name):
+    return re.sub(r'[\\/:*?"<>|\n\r]+', '_', str(name)).strip() or "_"
+
+def pack_files(df, misc_df=None):
+    """One project / PM pack: Output Details workbook and Pole Work Instructions."""
+    files = [("Gaeltec_Output.xlsx", build_output_workbook(df).getvalue())]
+    poles_df = build_poles_df(df, misc_df) if misc_df is not None else None
+    if poles_df is not None and not poles_df.empty:
+        files.append(("Pole_Work_Instructions.docx", poles_to_word(poles_df).getvalue()))
+    return files
+
+def bundle_files(df, misc_df=None):
+    """Every dashboard export for one partition, as (filename, bytes)."""
+    files = pack_files(df, misc_df)
+
+    revenue_per_project, revenue_per_team = revenue_tables(build_rollup_cube(df))
+    files.append(("revenue_summary.xlsx", to_excel(revenue_per_project, revenue_per_team).getvalue()))
+
+    # The planning workbook's "Poles Summary" lists every pole by shire / project / segment
+    files.append(("High level planning.xlsx",
+                  generate_excel_styled_multilevel(df, df[df['pole'].notna()]).getvalue()))
+
+    for cat_name, _, _ in categories:
+        sub_df, bar_data = materials_category(df, cat_name)
+        if sub_df.empty:
+            continue
+        files.append((f"{cat_name}_Details_Aggregated.xlsx",
+                      materials_aggregated_excel(sub_df, bar_data).getvalue()))
+        files.append((f"{cat_name}_Details_Separated.xlsx",
+                      materials_separated_excel(sub_df, bar_data, MATERIALS_EXTRA_COLUMNS).getvalue()))
+    return files
+
+def partition_frames(df, by):
+    # (name, rows) per non-empty project / project manager
+    return [(name, part) for name, part in df.groupby(by, observed=True) if not part.empty]
+
+def bundle_zip(partitions, misc_df=None, render=pack_files, max_workers=None, processes=False) -> BytesIO:
+    """
+    Render each (name, df) partition with `render` on a worker pool and stream the
+    files into one ZIP, one folder per partition, as soon as each partition finishes.
+    Members are stored uncompressed: xlsx and docx are already zip archives.
+    Workers never outnumber the partitions. They are threads by default: a spawned
+    process re-imports `__main__`, which under Streamlit is the app script itself.
+    `processes=True` spawns processes instead, for callers with an import-safe main.
+    """
+    partitions = list(partitions)
+    buffer = BytesIO()
+    if not partitions:
+        zipfile.ZipFile(buffer, 'w').close()
+        buffer.seek(0)
+        return buffer
+    workers = min(len(partitions), max_workers or os.cpu_count() or 1)
+    if processes:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers)
+    with pool, zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zf:
+        futures = {pool.submit(render, part, misc_df): name for name, part in partitions}
+        for future in as_completed(futures):
+            folder = bundle_dirname(futures[future])
+            for filename, data in future.result():
+                zf.writestr(f"{folder}/{filename}", data)
+    buffer.seek(0)
+    return buffer
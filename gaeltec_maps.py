@@ -0,0 +1,191 @@
+# gaeltec_maps.py
+# Geometry store for the dashboard's map: the TopoJSON files in Maps/ are deduplicated
+# by content hash, parsed once and saved as a single GeoParquet file with one row per
+# area (ward or Westminster constituency). Loading the store is one parquet read.
+#
+#   python gaeltec_maps.py            # (re)build the store ahead of time
+
+import glob
+import hashlib
+import json
+import math
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+MAPS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Maps")
+CACHE_DIR = os.environ.get("GAELTEC_CACHE_DIR", ".cache")
+
+# Bump whenever the store layout changes
+GEOMETRY_STORE_VERSION = 2
+
+# Render levels: simplify tolerance (degrees) and coordinate decimals sent to the browser
+SIMPLIFY_LEVELS = {
+    'fine': (0.001, 5),
+    'medium': (0.005, 4),
+    'coarse': (0.01, 3),
+}
+
+# Name / code properties per area level, as found in the source files
+AREA_LEVELS = {
+    'ward': ('WD13NM', 'WD13CD'),
+    'constituency': ('PCON13NM', 'PCON13CD'),
+}
+
+
+def map_sources(maps_dir=MAPS_DIR):
+    return sorted(glob.glob(os.path.join(maps_dir, "*.json")))
+
+def unique_sources(paths):
+    """Content hash → first path with that content (several Maps/ files are copies)."""
+    unique = {}
+    for path in paths:
+        with open(path, 'rb') as f:
+            unique.setdefault(hashlib.sha256(f.read()).hexdigest(), path)
+    return unique
+
+def store_path(unique, cache_dir=CACHE_DIR):
+    digest = hashlib.sha256("|".join(sorted(unique)).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"areas_{digest}_v{GEOMETRY_STORE_VERSION}.parquet")
+
+def read_areas(path):
+    # One source file → name / code / level / source / geometry rows in WGS84
+    gdf = gpd.read_file(path)
+    if gdf.crs is not None:
+        gdf = gdf.to_crs(4326)
+    for level, (name_col, code_col) in AREA_LEVELS.items():
+        if name_col in gdf.columns:
+            return gpd.GeoDataFrame({
+                'name': gdf[name_col].astype(str),
+                'code': gdf[code_col].astype(str) if code_col in gdf.columns else gdf[name_col].astype(str),
+                'level': level,
+                'source': os.path.basename(path),
+            }, geometry=gdf.geometry.values, crs=4326)
+    return None
+
+def polygon_rings(geom, decimals):
+    # [[outer ring, *holes], ...] per polygon part, coordinates rounded to `decimals`
+    if geom is None or geom.is_empty:
+        return []
+    parts = geom.geoms if geom.geom_type == 'MultiPolygon' else [geom]
+    return [
+        [np.round(np.asarray(ring.coords)[:, :2], decimals).tolist() for ring in [part.exterior, *part.interiors]]
+        for part in parts
+    ]
+
+def add_render_columns(store):
+    """
+    Per-area columns the map needs at render time: quantized polygons for every
+    SIMPLIFY_LEVELS entry (compact JSON text), centroid and bounding box.
+    """
+    for level, (tolerance, decimals) in SIMPLIFY_LEVELS.items():
+        simplified = store.geometry.simplify(tolerance, preserve_topology=True)
+        store[f'polygons_{level}'] = [json.dumps(polygon_rings(g, decimals), separators=(',', ':'))
+                                      for g in simplified]
+    centroids = store.geometry.centroid
+    store['centroid_x'], store['centroid_y'] = centroids.x, centroids.y
+    bounds = store.geometry.bounds
+    for column in ['minx', 'miny', 'maxx', 'maxy']:
+        store[column] = bounds[column].to_numpy()
+    return store
+
+def build_geometry_store(maps_dir=MAPS_DIR, cache_dir=CACHE_DIR) -> gpd.GeoDataFrame:
+    """
+    Parse each distinct Maps/ file once and write the combined areas as GeoParquet.
+    Areas present in several files are kept once (by level and code).
+    """
+    unique = unique_sources(map_sources(maps_dir))
+    frames = [areas for areas in map(read_areas, unique.values()) if areas is not None]
+    if frames:
+        store = pd.concat(frames, ignore_index=True).drop_duplicates(['level', 'code'], ignore_index=True)
+        store = gpd.GeoDataFrame(store, geometry='geometry', crs=4326)
+    else:
+        store = gpd.GeoDataFrame({'name': [], 'code': [], 'level': [], 'source': []}, geometry=[], crs=4326)
+    store = add_render_columns(store)
+
+    path = store_path(unique, cache_dir)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        store.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # Read-only deployments rebuild the store in memory each process
+    return store
+
+def load_geometry_store(maps_dir=MAPS_DIR, cache_dir=CACHE_DIR) -> gpd.GeoDataFrame:
+    """
+    The area store for the current Maps/ contents, built on first use.
+    Only the source files are hashed here; no TopoJSON is parsed when the store exists.
+    """
+    path = store_path(unique_sources(map_sources(maps_dir)), cache_dir)
+    if os.path.exists(path):
+        try:
+            return gpd.read_parquet(path)
+        except Exception:
+            pass  # Corrupt or incompatible store → rebuild below
+    return build_geometry_store(maps_dir, cache_dir)
+
+def name_index(store, level='ward'):
+    # Area name → store row positions, for one level
+    index = {}
+    for pos, (name, area_level) in enumerate(zip(store['name'], store['level'])):
+        if area_level == level:
+            index.setdefault(name, []).append(pos)
+    return index
+
+def areas_by_name(store, index, names):
+    positions = sorted({pos for name in names for pos in index.get(name, ())})
+    return store.iloc[positions].copy()
+
+def map_view(areas):
+    """
+    (lon, lat, zoom) framing `areas`, from the cached centroids and bounding boxes.
+    The point is the mean of the area centroids; zoom fits the combined box.
+    """
+    span = max(areas['maxx'].max() - areas['minx'].min(), 2 * (areas['maxy'].max() - areas['miny'].min()))
+    zoom = min(13.0, max(5.0, math.log2(360 / max(span, 1e-3)) - 0.5))
+    return areas['centroid_x'].mean(), areas['centroid_y'].mean(), zoom
+
+def pick_level(n_areas, zoom):
+    # Coarser outlines when many areas are drawn or the view is zoomed out
+    if n_areas > 20 or zoom < 8:
+        return 'coarse'
+    if n_areas > 5 or zoom < 10:
+        return 'medium'
+    return 'fine'
+
+def polygon_payload(areas, level, columns=()):
+    """
+    One row per polygon part for a pydeck PolygonLayer (`polygon` = list of rings),
+    carrying `name` and any extra `columns` of the area.
+    """
+    rows = []
+    for record in areas[['name', f'polygons_{level}', *columns]].itertuples(index=False):
+        for rings in json.loads(record[1]):
+            rows.append({'name': record[0], 'polygon': rings, **dict(zip(columns, record[2:]))})
+    return pd.DataFrame(rows, columns=['name', 'polygon', *columns])
+
+def choropleth_colors(values, alpha=200):
+    """
+    [r, g, b, a] per value on a light-yellow → dark-red ramp, scaled to the
+    largest value (sqrt, so a few big areas don't wash out the rest).
+    """
+    values = np.nan_to_num(np.asarray(values, dtype=float).clip(min=0))
+    top = values.max() if len(values) else 0
+    t = np.sqrt(values / top) if top > 0 else np.zeros(len(values))
+    low, high = np.array([255, 237, 160]), np.array([189, 0, 38])
+    rgb = (low + (high - low) * t[:, None]).round().astype(int)
+    return [[*row, alpha] for row in rgb.tolist()]
+
+
+def main():
+    store = build_geometry_store()
+    counts = store['level'].value_counts().to_dict()
+    print(f"{len(store)} areas ({counts}) from {len(unique_sources(map_sources()))} distinct files")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+AppTest = pytest.importorskip("streamlit.testing.v1").AppTest
+
+# Builds a bundle the way the dashboard does, from a script run by Streamlit. Streamlit
+# registers the script as __main__, so a spawned worker would re-run it as __mp_main__.
+BUNDLE_SCRIPT = """
+import zipfile
+
+import streamlit as st
+
+from gaeltec_bench import synthetic_master, synthetic_misc
+from gaeltec_core import bundle_zip, partition_frames, prepare_dataframe
+
+raw = synthetic_master(400)
+df = prepare_dataframe(raw)
+bundle = bundle_zip(partition_frames(df, "projectmanager"), synthetic_misc(raw), max_workers=2)
+st.session_state["members"] = zipfile.ZipFile(bundle).namelist()
+st.session_state["managers"] = sorted(df["projectmanager"].dropna().astype(str).unique())
+"""
+
+
+def test_bundle_zip_under_streamlit():
+    at = AppTest.from_string(BUNDLE_SCRIPT, default_timeout=120).run()
+    assert not at.exception
+
+    members = at.session_state["members"]
+    folders = {member.split("/")[0] for member in members}
+    assert len(folders) == len(at.session_state["managers"])
+    for folder in folders:
+        assert f"{folder}/Gaeltec_Output.xlsx" in members
+    assert any(member.endswith("/Pole_Work_Instructions.docx") for member in members)